@@ -1,13 +1,24 @@
 import os
 import tempfile
+import uuid
+from functools import partial
 import streamlit as st
 
 # Disable Streamlit's file watcher to prevent PyTorch custom class errors
 os.environ["STREAMLIT_SERVER_FILE_WATCHER_TYPE"] = "none"
 from backend.document_processor import DocumentProcessor
+from backend.collection_registry import CollectionRegistry
 from backend.vector_store import FAISSVectorStore
 from backend.rag_chatbot import RAGChatbot
 from backend.ragate import RAGate
+from backend.ingestion_queue import IngestionQueue, JobStatus
+from backend.semantic_cache import SemanticCache
+from backend.conversation_memory import ConversationMemory
+from backend.llm_providers import create_llm
+from backend.session_manager import ChatHistory, SessionRegistry, format_bytes
+
+# Older chat messages are paged out here instead of staying in server memory
+SESSION_DIR = os.getenv("DOCUMIND_SESSION_DIR", os.path.join(tempfile.gettempdir(), "documind_sessions"))
 
 # Page configuration
 st.set_page_config(
@@ -92,21 +103,165 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_collection_registry():
+    """Create the process-wide collection registry shared by every session."""
+    model_name = os.getenv("DOCUMIND_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    registry = CollectionRegistry(model_name)
+    
+    # Start from a bulk-ingested snapshot if one is configured; its documents are public
+    index_dir = os.getenv("DOCUMIND_INDEX_DIR")
+    if index_dir and FAISSVectorStore.snapshot_path(index_dir) is not None:
+        collection = registry.load_collection("documents", index_dir)
+        # Snapshot built with another model: keep serving it while re-embedding in the background
+        if collection.store.model_name != model_name:
+            registry.migrate_collection("documents", model_name)
+    else:
+        registry.create_collection("documents")
+    return registry
+
+@st.cache_resource
+def get_llm():
+    """Create the process-wide LLM client so its circuit breaker sees every session's calls."""
+    return create_llm(timeout=30.0, max_retries=3, hedge_after=10.0, deadline=60.0)
+
+@st.cache_resource
+def get_session_registry():
+    """Create the process-wide registry that releases the resources of idle sessions."""
+    return SessionRegistry(
+        idle_timeout=float(os.getenv("DOCUMIND_SESSION_IDLE_TIMEOUT", "1800")),
+        spill_dir=SESSION_DIR,
+        spill_ttl=float(os.getenv("DOCUMIND_SESSION_SPILL_TTL", "86400"))
+    )
+
+def release_session(vector_store, ingestion_queue, semantic_cache, chat_history):
+    """Free an idle session's workers, private index entries, cache and in-memory chat."""
+    ingestion_queue.shutdown()
+    # Closing (not just clearing) the view makes a job already indexing fail as
+    # cancelled instead of re-adding documents after the release
+    vector_store.close()
+    semantic_cache.invalidate()
+    chat_history.spill_all()
+
 # Initialize session state variables
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = uuid.uuid4().hex
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistory(
+        get_session_registry().spill_path(st.session_state.tenant_id),
+        window=40
+    )
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 0
+
+# A session released while idle gets fresh resources (its uploads were dropped)
+if get_session_registry().was_evicted(st.session_state.tenant_id):
+    for key in ["vector_store", "loaded_files", "semantic_cache", "conversation_memory",
+                "ingestion_queue", "submitted_files", "ingestion_errors"]:
+        st.session_state.pop(key, None)
+    st.session_state.session_evicted = True
 if "vector_store" not in st.session_state:
-    st.session_state.vector_store = FAISSVectorStore()
+    # Each session sees its own uploads plus public documents in the shared index;
+    # identical files uploaded by different sessions are embedded only once
+    st.session_state.vector_store = get_collection_registry().view("documents", st.session_state.tenant_id)
 if "document_processor" not in st.session_state:
-    st.session_state.document_processor = DocumentProcessor(chunk_size=1000, chunk_overlap=200)
+    # Small child chunks are embedded for precise matching; their 2000-character
+    # parent sections are what the LLM sees as context
+    st.session_state.document_processor = DocumentProcessor(
+        chunk_size=2000,
+        chunk_overlap=200,
+        child_chunk_size=400,
+        child_chunk_overlap=50
+    )
 if "loaded_files" not in st.session_state:
-    st.session_state.loaded_files = []
+    st.session_state.loaded_files = sorted(st.session_state.vector_store.get_document_sources())
 if "use_ragate" not in st.session_state:
     st.session_state.use_ragate = True
 if "show_debug_info" not in st.session_state:
     st.session_state.show_debug_info = False
 if "confidence_threshold" not in st.session_state:
     st.session_state.confidence_threshold = 0.7
+if "semantic_cache" not in st.session_state:
+    st.session_state.semantic_cache = SemanticCache(st.session_state.vector_store, similarity_threshold=0.92)
+if "conversation_memory" not in st.session_state:
+    st.session_state.conversation_memory = ConversationMemory(max_recent_turns=3, summary_token_budget=300)
+if "query_expansion" not in st.session_state:
+    st.session_state.query_expansion = "none"
+if "use_mmr" not in st.session_state:
+    st.session_state.use_mmr = False
+if "mmr_lambda" not in st.session_state:
+    st.session_state.mmr_lambda = 0.5
+if "use_extractive" not in st.session_state:
+    st.session_state.use_extractive = True
+if "ingestion_queue" not in st.session_state:
+    st.session_state.ingestion_queue = IngestionQueue(
+        st.session_state.vector_store,
+        st.session_state.document_processor,
+        max_workers=2
+    )
+if "submitted_files" not in st.session_state:
+    st.session_state.submitted_files = set()
+if "ingestion_errors" not in st.session_state:
+    st.session_state.ingestion_errors = {}
+
+get_session_registry().touch(
+    st.session_state.tenant_id,
+    release=partial(
+        release_session,
+        st.session_state.vector_store,
+        st.session_state.ingestion_queue,
+        st.session_state.semantic_cache,
+        st.session_state.chat_history
+    )
+)
+
+
+def sync_ingestion_jobs():
+    """Move finished background jobs into the list of loaded files."""
+    for job in st.session_state.ingestion_queue.pop_finished():
+        if job.status == JobStatus.DONE:
+            if job.filename not in st.session_state.loaded_files:
+                st.session_state.loaded_files.append(job.filename)
+            # Force update document sources after adding new documents
+            if "document_sources" in st.session_state:
+                del st.session_state["document_sources"]
+        elif job.status == JobStatus.FAILED:
+            st.session_state.ingestion_errors[job.filename] = job.error
+
+
+def render_ingestion_status():
+    """Show progress for queued and running ingestion jobs."""
+    sync_ingestion_jobs()
+    active_jobs = st.session_state.ingestion_queue.active_jobs()
+    for job in active_jobs:
+        status_col, cancel_col = st.columns([4, 1])
+        with status_col:
+            st.progress(job.progress, text=f"{job.filename}: {job.stage}")
+        with cancel_col:
+            if st.button("✖", key=f"cancel_{job.job_id}", help=f"Cancel {job.filename}"):
+                st.session_state.ingestion_queue.cancel(job.job_id)
+    for filename, error in list(st.session_state.ingestion_errors.items()):
+        st.error(f"❌ Error processing {filename}: {error}")
+    if st.session_state.get("ingestion_polling") and not active_jobs:
+        # The last job finished: rerun the whole app once to stop polling
+        st.rerun()
+
+
+def show_ingestion_status():
+    """
+    Render the ingestion status, refreshing it on a timer only while jobs are active.
+
+    With fragment support the status updates every 2 seconds without rerunning the
+    chat; with nothing to ingest no timer runs, so idle tabs cost nothing.
+    """
+    polling = hasattr(st, "fragment") and bool(st.session_state.ingestion_queue.active_jobs())
+    st.session_state.ingestion_polling = polling
+    if polling:
+        st.fragment(run_every=2)(render_ingestion_status)()
+    else:
+        render_ingestion_status()
+
+sync_ingestion_jobs()
 
 # Application header with improved styling and concise description - made smaller
 st.markdown("""
@@ -119,6 +274,9 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+if st.session_state.pop("session_evicted", False):
+    st.warning("This session was idle for a while, so its documents were unloaded to free server memory. Please upload them again.")
+
 # Sidebar for document upload and settings with improved styling
 with st.sidebar:
     st.markdown("""
@@ -133,51 +291,40 @@ with st.sidebar:
     )
     
     if uploaded_files:
-        all_processed = True
         for pdf_file in uploaded_files:
-            if pdf_file.name not in st.session_state.loaded_files:
-                st.text(f"Processing: {pdf_file.name}")
-                
-                # Save the uploaded file temporarily
+            if pdf_file.name not in st.session_state.submitted_files:
+                # Save the uploaded file temporarily; the ingestion job deletes it when done
                 with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
                     tmp_file.write(pdf_file.getvalue())
                     tmp_path = tmp_file.name
                 
-                try:
-                    # Process the PDF file using the original filename as source
-                    documents = st.session_state.document_processor.process_pdf(
-                        pdf_path=tmp_path,
-                        original_filename=pdf_file.name
-                    )
-                    
-                    # Add documents to vector store
-                    st.session_state.vector_store.add_documents(documents)
-                    
-                    # Force update document sources after adding new documents
-                    if "document_sources" in st.session_state:
-                        del st.session_state["document_sources"]
-                    
-                    # Add file to loaded files list
-                    st.session_state.loaded_files.append(pdf_file.name)
-                    
-                    st.success(f"✅ {pdf_file.name} processed and added to database!")
-                except Exception as e:
-                    st.error(f"❌ Error processing {pdf_file.name}: {str(e)}")
-                    all_processed = False
-                finally:
-                    # Clean up the temporary file
-                    os.unlink(tmp_path)
-        
-        if all_processed and st.session_state.loaded_files:
-            st.success(f"All documents processed! You can now ask questions about them.")
+                # Process the PDF in the background using the original filename as source
+                st.session_state.ingestion_queue.submit(pdf_file.name, tmp_path)
+                st.session_state.submitted_files.add(pdf_file.name)
+                st.session_state.ingestion_errors.pop(pdf_file.name, None)
+    
+    show_ingestion_status()
+    
+    if st.session_state.loaded_files and not st.session_state.ingestion_queue.active_jobs():
+        st.success(f"All documents processed! You can now ask questions about them.")
+    elif st.session_state.loaded_files:
+        st.info(f"{len(st.session_state.loaded_files)} document(s) ready. You can ask questions while the rest are processed.")
     
     st.divider()
     
     # Add option to clear the database
     if st.button("🗑️ Clear Database"):
+        # Wait for running jobs to stop so none can add its documents after the clear,
+        # then drop them so they aren't listed as loaded again
+        st.session_state.ingestion_queue.cancel_all(wait=True)
         st.session_state.vector_store.clear()
+        st.session_state.ingestion_queue.pop_finished()
         st.session_state.loaded_files = []
-        st.session_state.chat_history = []
+        st.session_state.submitted_files = set()
+        st.session_state.ingestion_errors = {}
+        st.session_state.chat_history.clear()
+        st.session_state.history_pages = 0
+        st.session_state.conversation_memory.clear()
         
         # Clear document sources
         if "document_sources" in st.session_state:
@@ -228,14 +375,102 @@ with chat_controls_col2:
             help="Threshold for deciding when to use retrieval"
         )
         
+        expansion_modes = ["none", "local", "multi_query", "hyde"]
+        st.session_state.query_expansion = st.selectbox(
+            "Query expansion",
+            options=expansion_modes,
+            index=expansion_modes.index(st.session_state.query_expansion),
+            help="Search with rewritten variants of the question: local rewrites, LLM paraphrases, or paraphrases plus a hypothetical answer (HyDE)"
+        )
+        
+        st.session_state.use_mmr = st.checkbox(
+            "Diversify results (MMR)",
+            value=st.session_state.use_mmr,
+            help="Avoid retrieving several near-identical overlapping chunks"
+        )
+        
+        if st.session_state.use_mmr:
+            st.session_state.mmr_lambda = st.slider(
+                "Relevance vs. diversity",
+                min_value=0.0,
+                max_value=1.0,
+                value=st.session_state.mmr_lambda,
+                step=0.05,
+                help="1.0 ranks purely by relevance, lower values favour diverse chunks"
+            )
+        
+        st.session_state.use_extractive = st.checkbox(
+            "Fast lookup answers",
+            value=st.session_state.use_extractive,
+            help="Answer simple lookups (emails, phone numbers, dates, labelled fields) straight from the documents without calling the LLM"
+        )
+        
+        st.session_state.semantic_cache.similarity_threshold = st.slider(
+            "Cache similarity",
+            min_value=0.80,
+            max_value=1.0,
+            value=st.session_state.semantic_cache.similarity_threshold,
+            step=0.01,
+            help="Minimum similarity to an earlier question for reusing its answer"
+        )
+        
         st.session_state.show_debug_info = st.checkbox(
             "Show debug info", 
             value=st.session_state.show_debug_info,
             help="Display RAGate decision information in responses"
         )
+        
+        if st.session_state.show_debug_info:
+            cache_stats = st.session_state.semantic_cache.stats()
+            st.caption(
+                f"Cache: {cache_stats['size']} entries, "
+                f"hit rate {cache_stats['hit_rate']:.0%} "
+                f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})"
+            )
+            llm_stats = get_llm().stats()
+            st.caption(
+                f"LLM: {llm_stats['calls']} calls, {llm_stats['retries']} retries, "
+                f"{llm_stats['hedges']} hedged, {llm_stats['timeouts']} timeouts, "
+                f"{llm_stats['queue_timeouts']} queue timeouts, circuit {llm_stats['circuit']}"
+            )
+            index_stats = st.session_state.vector_store.collection.stats()
+            st.caption(
+                f"Shared index: {index_stats['unique_documents']} unique documents, "
+                f"{index_stats['vectors']} vectors, {index_stats['tenants']} sessions"
+            )
+            history = st.session_state.chat_history
+            usage = {
+                "chat": history.memory_bytes(),
+                "conversation memory": st.session_state.conversation_memory.memory_bytes(),
+                "cache": st.session_state.semantic_cache.memory_bytes(),
+                "private index": st.session_state.vector_store.memory_bytes(),
+            }
+            st.caption(
+                f"Session memory: {format_bytes(sum(usage.values()))} ("
+                + ", ".join(f"{name} {format_bytes(size)}" for name, size in usage.items())
+                + f"), {history.spilled} messages on disk"
+            )
+            session_stats = get_session_registry().stats()
+            st.caption(
+                f"Sessions: {session_stats['active_sessions']} active, {session_stats['evictions']} released "
+                f"after {session_stats['idle_timeout'] / 60:.0f} min idle"
+            )
+            migration = st.session_state.vector_store.store.migration_status()
+            if migration is not None and migration["status"] != "done":
+                st.caption(
+                    f"Embedding migration to {migration['model_name']}: {migration['status']}, "
+                    f"{migration['done']}/{migration['total']} chunks"
+                )
 
-# Display chat history
-for message in st.session_state.chat_history:
+# Display chat history: only the in-memory window, plus older pages loaded from disk on request
+chat_history = st.session_state.chat_history
+if chat_history.spilled > st.session_state.history_pages * chat_history.window:
+    if st.button(f"Show earlier messages ({chat_history.spilled} on disk)"):
+        st.session_state.history_pages += 1
+for message in chat_history.load_spilled(st.session_state.history_pages * chat_history.window):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+for message in chat_history:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
@@ -258,45 +493,78 @@ if prompt := st.chat_input("Ask a question about your PDFs..."):
     with st.chat_message("assistant"):
         response_placeholder = st.empty()
         
-        if not st.session_state.loaded_files:
+        if not st.session_state.loaded_files and st.session_state.ingestion_queue.active_jobs():
+            response = "Your documents are still being processed. Please ask again once the first one is ready."
+        elif not st.session_state.loaded_files:
             response = "Please upload PDF documents first before asking questions."
         else:
             try:
                 # Initialize RAG chatbot with RAGate settings
                 chatbot = RAGChatbot(
                     confidence_threshold=st.session_state.confidence_threshold,
-                    use_ragate=st.session_state.use_ragate
+                    use_ragate=st.session_state.use_ragate,
+                    query_expansion=st.session_state.query_expansion,
+                    mmr_lambda=st.session_state.mmr_lambda if st.session_state.use_mmr else None,
+                    semantic_cache=st.session_state.semantic_cache,
+                    parent_resolver=st.session_state.vector_store.get_parent,
+                    llm=get_llm(),
+                    use_extractive=st.session_state.use_extractive
                 )
                 
+                memory = st.session_state.conversation_memory
+                
+                # Turn follow-ups like "and the second one?" into a standalone question
+                question = chatbot.condense_question(prompt, memory)
+                
                 # Get retrieval decision (for debug info)
-                use_retrieval, confidence, explanation = chatbot.decide_retrieval(prompt)
+                use_retrieval, confidence, explanation = chatbot.decide_retrieval(question)
                 
                 # Show debug info if enabled
                 if st.session_state.show_debug_info:
+                    if question != prompt:
+                        st.info(f"Standalone question: {question}")
                     st.info(f"RAGate: {explanation}")
                 
-                # Get relevant documents for the query
-                with st.spinner("Searching for relevant information..."):
-                    # If a specific document is selected, filter search by that document
-                    source_filter = None if selected_document == "All Documents" else selected_document
-                    relevant_docs = st.session_state.vector_store.similarity_search(
-                        prompt, 
-                        k=4, 
-                        source_filter=source_filter
-                    )
+                # If a specific document is selected, filter search by that document
+                source_filter = None if selected_document == "All Documents" else selected_document
                 
-                # Show retrieved document context details in an expander
-                with st.expander("View Retrieved Context", expanded=False):
-                    st.markdown("### Retrieved Document Chunks")
-                    for i, doc in enumerate(relevant_docs):
-                        source = doc.metadata.get("source", "Unknown")
-                        st.markdown(f"**Chunk {i+1}** from **{source}**")
-                        st.text(doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content)
-                        st.divider()
+                # Answer paraphrases of earlier questions from the semantic cache
+                cached_response = chatbot.lookup_cached_answer(question, source_filter=source_filter, memory=memory)
                 
-                # Generate response with Gemini
-                with st.spinner("Generating response..."):
-                    response = chatbot.answer_question(prompt, relevant_docs)
+                if cached_response is not None:
+                    response = cached_response
+                    chatbot.remember(memory, question, response)
+                    if st.session_state.show_debug_info:
+                        st.info("Answered from semantic cache")
+                else:
+                    # Get relevant documents for the query
+                    with st.spinner("Searching for relevant information..."):
+                        # Skip the search (and any query expansion) when RAGate will answer directly
+                        relevant_docs = chatbot.retrieve(
+                            question,
+                            st.session_state.vector_store,
+                            k=4,
+                            source_filter=source_filter
+                        ) if use_retrieval else []
+                    
+                    # Show retrieved document context details in an expander
+                    with st.expander("View Retrieved Context", expanded=False):
+                        st.markdown("### Retrieved Document Chunks")
+                        for i, doc in enumerate(relevant_docs):
+                            source = doc.metadata.get("source", "Unknown")
+                            st.markdown(f"**Chunk {i+1}** from **{source}**")
+                            st.text(doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content)
+                            st.divider()
+                    
+                    # Generate response with Gemini
+                    with st.spinner("Generating response..."):
+                        response = chatbot.answer_question(
+                            question,
+                            relevant_docs,
+                            source_filter=source_filter,
+                            cache_checked=True,
+                            memory=memory
+                        )
             except Exception as e:
                 response = f"Error: {str(e)}"
         
@@ -0,0 +1,370 @@
+"""
+Bulk Offline Ingestion
+
+Command-line tool that builds a persisted FAISSVectorStore snapshot from a directory
+(or manifest file) of PDFs, for corpora far too large to upload through the UI.
+
+PDF extraction and chunking run across a process pool, embeddings are computed in
+large batches in the main process, and every batch is appended to the store's
+write-ahead log in the output directory as soon as it is embedded. Re-running the
+command resumes after a crash and skips files whose content hash has not changed.
+
+Usage:
+    python -m backend.bulk_ingest path/to/pdfs --output data/index
+    python -m backend.bulk_ingest files.txt --output data/index --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema.document import Document
+
+from backend.document_processor import DocumentProcessor
+from backend.vector_store import FAISSVectorStore
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Texts per model forward pass when embedding a flushed batch
+ENCODE_BATCH_SIZE = 128
+
+# Per-process document processor, created once by the pool initializer
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int, child_chunk_size: Optional[int]) -> None:
+    """Create the document processor for a worker process."""
+    global _worker_processor
+    _worker_processor = DocumentProcessor(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        child_chunk_size=child_chunk_size
+    )
+
+
+def _hash_file(path: str) -> Tuple[str, Optional[str]]:
+    """Hash a file in a worker process."""
+    try:
+        return path, DocumentProcessor.hash_file(path)
+    except OSError:
+        return path, None
+
+
+def _process_file(task: Tuple[str, str, str]) -> Tuple[str, str, Optional[List[Tuple[str, Dict]]],
+                                                       List[Tuple[str, Dict]], Optional[str]]:
+    """
+    Extract and chunk one PDF in a worker process.
+
+    Returns plain (text, metadata) tuples rather than Document objects to keep
+    the data sent back to the main process small and simple to pickle. The
+    parent list is empty unless the processor builds a chunk hierarchy.
+    """
+    path, source, file_hash = task
+    try:
+        parents = []
+        if _worker_processor.hierarchical:
+            parents, chunks = _worker_processor.process_pdf_hierarchical(path, original_filename=source)
+        else:
+            chunks = _worker_processor.process_pdf(path, original_filename=source)
+        for chunk in parents + chunks:
+            chunk.metadata["doc_hash"] = file_hash
+        return (
+            path,
+            file_hash,
+            [(chunk.page_content, chunk.metadata) for chunk in chunks],
+            [(parent.page_content, parent.metadata) for parent in parents],
+            None,
+        )
+    except Exception as e:
+        return path, file_hash, None, [], str(e)
+
+
+def _bounded_map(pool: ProcessPoolExecutor, fn: Callable, items: Iterable, max_in_flight: int) -> Iterator:
+    """
+    Like pool.map, but yields results in completion order and never has more than
+    max_in_flight tasks outstanding, so a slow consumer (embedding) can't let
+    extracted chunks pile up in memory.
+    """
+    items = iter(items)
+    in_flight = set()
+    for item in items:
+        in_flight.add(pool.submit(fn, item))
+        if len(in_flight) >= max_in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in in_flight:
+        yield future.result()
+
+
+def discover_pdfs(input_path: str) -> Tuple[List[str], str]:
+    """
+    Find the PDFs to ingest.
+
+    Args:
+        input_path: Directory to walk recursively, or a manifest file listing one PDF path per line
+
+    Returns:
+        Tuple of (absolute PDF paths, base directory used to derive source names)
+    """
+    if os.path.isdir(input_path):
+        base_dir = os.path.abspath(input_path)
+        paths = []
+        for root, _, files in os.walk(base_dir):
+            for name in files:
+                if name.lower().endswith(".pdf"):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths), base_dir
+
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    paths = []
+    with open(input_path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                paths.append(os.path.abspath(os.path.join(base_dir, line)))
+    return paths, base_dir
+
+
+def _load_manifest(output_dir: str) -> Dict[str, Dict]:
+    """Load the record of already-ingested files."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(output_dir: str, manifest: Dict[str, Dict]) -> None:
+    """Atomically write the record of ingested files."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+class BulkIngester:
+    """
+    Resumable bulk ingestion of PDFs into a persisted vector store.
+
+    The store is opened durably: every embedded batch is appended to its write-ahead
+    log as it is added, and the log is compacted into a snapshot in the background.
+    The manifest in the output directory maps each source name to the hash of the
+    file it was built from. It is written at checkpoints and reconciled with the
+    store on startup, so after a crash only files whose batch never reached the log
+    are re-ingested (their old chunks, if any, are removed first, so nothing is
+    duplicated).
+    """
+
+    def __init__(self, output_dir: str, model_name: Optional[str] = None,
+                 chunk_size: int = 1000, chunk_overlap: int = 200,
+                 child_chunk_size: Optional[int] = None, workers: int = None,
+                 embed_batch_size: int = 1024, checkpoint_every: int = 200):
+        """
+        Initialize the bulk ingester.
+
+        Args:
+            output_dir: Directory holding the store snapshot and the ingest manifest
+            model_name: Sentence transformer model; an existing store built with another
+                        model is re-embedded with it first (default: keep the store's
+                        model, all-MiniLM-L6-v2 for new stores)
+            chunk_size: Size of text chunks
+            chunk_overlap: Overlap between chunks
+            child_chunk_size: If set, embed small child chunks of this size that map
+                              back to chunk_size parent sections
+            workers: Number of extraction processes (default: CPU count)
+            embed_batch_size: Minimum number of chunks embedded together
+            checkpoint_every: Number of files between manifest checkpoints
+        """
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.child_chunk_size = child_chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+        self.checkpoint_every = checkpoint_every
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.store = FAISSVectorStore.open(output_dir, model_name=model_name or "all-MiniLM-L6-v2")
+        if model_name is not None and self.store.model_name != model_name:
+            print(f"🔁 Re-embedding {len(self.store.documents)} chunks from {self.store.model_name} to {model_name}")
+            self.store.migrate_now(model_name, batch_size=ENCODE_BATCH_SIZE)
+            self.store.compact()
+        self.store.start_background_compaction(interval=30.0, min_log_bytes=256 * 1024 * 1024)
+        self.manifest = _load_manifest(output_dir)
+        self._reconcile_manifest()
+
+        self._pending: List[Tuple[str, str, List[Tuple[str, Dict]], List[Tuple[str, Dict]]]] = []
+        self._pending_chunks = 0
+        self._files_since_checkpoint = 0
+
+    def _reconcile_manifest(self) -> None:
+        """Bring the manifest in line with the store after a crash between checkpoints."""
+        indexed: Dict[str, Dict] = {}
+        for doc in self.store.documents:
+            entry = indexed.setdefault(doc.metadata.get("source"), {"sha256": doc.metadata.get("doc_hash"), "chunks": 0})
+            entry["chunks"] += 1
+
+        for source, entry in list(self.manifest.items()):
+            # Removed but never re-added before the crash: ingest it again
+            if entry.get("chunks") and source not in indexed:
+                del self.manifest[source]
+        for source, entry in indexed.items():
+            # Logged after the last checkpoint: no need to embed it again
+            if entry["sha256"] is not None and self.manifest.get(source, {}).get("sha256") != entry["sha256"]:
+                self.manifest[source] = entry
+
+    def _flush(self) -> None:
+        """Embed all buffered chunks in one batch and add them to the store."""
+        if not self._pending:
+            return
+
+        documents, parents = [], []
+        for _, _, chunks, file_parents in self._pending:
+            # Parent positions are per file; shift them into the combined parent list
+            offset = len(parents)
+            parents.extend(Document(page_content=text, metadata=metadata) for text, metadata in file_parents)
+            for text, metadata in chunks:
+                if "parent_index" in metadata:
+                    metadata["parent_index"] += offset
+                documents.append(Document(page_content=text, metadata=metadata))
+        embeddings = self.store.embed_documents(
+            [doc.page_content for doc in documents],
+            batch_size=ENCODE_BATCH_SIZE
+        )
+
+        sources = [source for source, _, _, _ in self._pending]
+        self.store.remove_sources(sources)
+        self.store.add_documents(documents, embeddings=embeddings, parents=parents or None)
+
+        for source, file_hash, chunks, _ in self._pending:
+            self.manifest[source] = {"sha256": file_hash, "chunks": len(chunks)}
+        self._files_since_checkpoint += len(self._pending)
+        self._pending = []
+        self._pending_chunks = 0
+
+        if self._files_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Write the manifest (the store itself is already durable through its write-ahead log)."""
+        _save_manifest(self.output_dir, self.manifest)
+        self._files_since_checkpoint = 0
+
+    def run(self, input_path: str, prune: bool = False) -> Dict[str, int]:
+        """
+        Ingest every PDF under input_path.
+
+        Args:
+            input_path: Directory or manifest file of PDFs
+            prune: Whether to remove sources whose files no longer exist
+
+        Returns:
+            Dictionary of counts: total, skipped, ingested, failed, pruned
+        """
+        paths, base_dir = discover_pdfs(input_path)
+        sources = {path: os.path.relpath(path, base_dir).replace(os.sep, "/") for path in paths}
+        stats = {"total": len(paths), "skipped": 0, "ingested": 0, "failed": 0, "pruned": 0}
+        print(f"📂 Found {len(paths)} PDF files")
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.chunk_size, self.chunk_overlap, self.child_chunk_size)) as pool:
+            # Hash every file first so unchanged files never get extracted
+            tasks = []
+            for path, file_hash in pool.map(_hash_file, paths, chunksize=64):
+                source = sources[path]
+                if file_hash is None:
+                    stats["failed"] += 1
+                    print(f"❌ Could not read {source}")
+                elif self.manifest.get(source, {}).get("sha256") == file_hash:
+                    stats["skipped"] += 1
+                else:
+                    tasks.append((path, source, file_hash))
+            print(f"⏭️  Skipping {stats['skipped']} unchanged files, processing {len(tasks)}")
+
+            start = time.time()
+            results = _bounded_map(pool, _process_file, tasks, max_in_flight=self.workers * 4)
+            for done, (path, file_hash, chunks, parents, error) in enumerate(results, 1):
+                source = sources[path]
+                if error is not None:
+                    stats["failed"] += 1
+                    print(f"❌ Error processing {source}: {error}")
+                    continue
+
+                self._pending.append((source, file_hash, chunks, parents))
+                self._pending_chunks += len(chunks)
+                stats["ingested"] += 1
+                if self._pending_chunks >= self.embed_batch_size:
+                    self._flush()
+
+                if done % 100 == 0 or done == len(tasks):
+                    rate = done / max(time.time() - start, 1e-6)
+                    print(f"📄 {done}/{len(tasks)} files ({rate:.1f} files/s)")
+
+        self._flush()
+
+        if prune:
+            missing = set(self.manifest) - set(sources.values())
+            if missing:
+                self.store.remove_sources(missing)
+                for source in missing:
+                    del self.manifest[source]
+                stats["pruned"] = len(missing)
+
+        # Leave a compact snapshot behind for the app to load
+        self.store.compact()
+        self.store.close()
+        self.checkpoint()
+        return stats
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into a persisted DocuMind vector store.")
+    parser.add_argument("input", help="Directory of PDFs (searched recursively) or a text file listing PDF paths")
+    parser.add_argument("--output", "-o", default="data/index", help="Snapshot directory (default: data/index)")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--model", default=None,
+                        help="Sentence transformer model; re-embeds an existing store built with another model "
+                             "(default: the store's model, all-MiniLM-L6-v2 for new stores)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Size of text chunks")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="Overlap between chunks")
+    parser.add_argument("--child-chunk-size", type=int, default=None,
+                        help="Embed small child chunks of this size that map back to --chunk-size parent sections")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Chunks embedded per batch")
+    parser.add_argument("--checkpoint-every", type=int, default=200, help="Files between manifest checkpoints")
+    parser.add_argument("--prune", action="store_true", help="Remove documents whose files no longer exist")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"❌ Error: {args.input} does not exist")
+        return 1
+
+    ingester = BulkIngester(
+        output_dir=args.output,
+        model_name=args.model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        child_chunk_size=args.child_chunk_size,
+        workers=args.workers,
+        embed_batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint_every,
+    )
+    stats = ingester.run(args.input, prune=args.prune)
+
+    print(
+        f"✅ Done: {stats['ingested']} ingested, {stats['skipped']} unchanged, "
+        f"{stats['failed']} failed, {stats['pruned']} pruned"
+    )
+    print(f"💾 Snapshot written to {args.output} (set DOCUMIND_INDEX_DIR={args.output} to load it in the app)")
+    return 0 if stats["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,575 @@
+"""
+Collection Registry
+
+This module holds process-level, multi-tenant document collections so that many
+Streamlit sessions can share one embedding model and one index per collection.
+Documents are content-addressed by the SHA-256 of their source file: a file that is
+already in a collection is never embedded again, the uploading tenant just gains a
+reference to it. Memory and ingestion cost therefore scale with unique documents, not
+with the number of users.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from langchain.schema.document import Document
+from backend.embedding_models import EmbeddingModelRegistry, default_registry
+from backend.ingestion_queue import JobCancelled
+from backend.vector_store import EmbeddingMigration, FAISSVectorStore
+
+
+class Collection:
+    """
+    A named, shared vector store with per-tenant document visibility.
+
+    Documents are either public (visible to every tenant, e.g. a bulk-ingested
+    library) or referenced (visible only to the tenants that uploaded them). A
+    referenced document is removed from the index once its last reference is
+    released. Collections with an owner can only be accessed by that tenant.
+    """
+
+    def __init__(self, name: str, store: FAISSVectorStore, owner: Optional[str] = None,
+                 public_existing: bool = False):
+        """
+        Initialize a collection.
+
+        Args:
+            name: Collection name
+            store: Vector store backing the collection
+            owner: Tenant that owns the collection, or None for a shared collection
+            public_existing: Whether documents already in the store are visible to all tenants
+        """
+        self.name = name
+        self.store = store
+        self.owner = owner
+        self._lock = threading.RLock()
+        self._refs: Dict[str, Set[str]] = {}
+        self._tenant_docs: Dict[str, Set[str]] = {}
+        self._public: Set[str] = set()
+        self._public_sources: Dict[str, str] = {}
+        # Bumped whenever the set of public documents changes
+        self.public_version = 0
+
+        if public_existing:
+            _assign_content_hashes(store.documents)
+            for doc in store.documents:
+                self._public_sources[_doc_hash(doc)] = doc.metadata.get("source", "unknown")
+            self._public = set(self._public_sources)
+
+    def can_access(self, tenant_id: str) -> bool:
+        """Whether a tenant may use this collection."""
+        return self.owner is None or self.owner == tenant_id
+
+    def has_document(self, doc_hash: str) -> bool:
+        """Whether a document with this content hash is already indexed."""
+        with self._lock:
+            return doc_hash in self._refs or doc_hash in self._public
+
+    def visible_hashes(self, tenant_id: str) -> Set[str]:
+        """
+        Get the content hashes a tenant can search.
+
+        Args:
+            tenant_id: Tenant to check
+
+        Returns:
+            Set of public hashes plus those referenced by the tenant
+        """
+        with self._lock:
+            return self._public | self._tenant_docs.get(tenant_id, set())
+
+    def reference(self, doc_hash: str, tenant_id: str) -> bool:
+        """
+        Give a tenant access to an already-indexed document.
+
+        Args:
+            doc_hash: Content hash of the document
+            tenant_id: Tenant gaining access
+
+        Returns:
+            True if the document exists and is now referenced by the tenant
+        """
+        with self._lock:
+            if not self.has_document(doc_hash):
+                return False
+            if doc_hash not in self._public:
+                self._refs.setdefault(doc_hash, set()).add(tenant_id)
+            self._tenant_docs.setdefault(tenant_id, set()).add(doc_hash)
+            return True
+
+    def add_documents(self, documents: List[Document], tenant_id: str,
+                      embeddings: Optional[np.ndarray] = None, public: bool = False,
+                      parents: Optional[List[Document]] = None, model_name: Optional[str] = None) -> None:
+        """
+        Add chunks on behalf of a tenant, skipping files that are already indexed.
+
+        Args:
+            documents: Chunks to add; chunks without a doc_hash get one from their file's content
+            tenant_id: Tenant adding the documents
+            embeddings: Optional precomputed embeddings, one row per document
+            public: Whether the documents should be visible to every tenant
+            parents: Optional parent sections referenced by the chunks' parent_index
+            model_name: Model that produced the precomputed embeddings
+        """
+        _assign_content_hashes(documents)
+        with self._lock:
+            keep = [i for i, doc in enumerate(documents) if not self.has_document(_doc_hash(doc))]
+            if keep:
+                new_docs = [documents[i] for i in keep]
+                new_embeddings = embeddings[keep] if embeddings is not None else None
+                new_parents = None
+                if parents:
+                    # Only keep the parents of new chunks and renumber them
+                    parent_positions = sorted({doc.metadata["parent_index"] for doc in new_docs if "parent_index" in doc.metadata})
+                    renumber = {old: new for new, old in enumerate(parent_positions)}
+                    new_parents = [parents[old] for old in parent_positions]
+                    for doc in new_docs:
+                        if "parent_index" in doc.metadata:
+                            doc.metadata["parent_index"] = renumber[doc.metadata["parent_index"]]
+                self.store.add_documents(new_docs, embeddings=new_embeddings, parents=new_parents,
+                                         model_name=model_name)
+
+            for doc_hash, source in {_doc_hash(doc): doc.metadata.get("source", "unknown") for doc in documents}.items():
+                if public:
+                    if doc_hash not in self._public:
+                        self.public_version += 1
+                    self._public.add(doc_hash)
+                    self._public_sources[doc_hash] = source
+                    self._refs.pop(doc_hash, None)
+                else:
+                    # Public documents are never reference-counted, as in reference()
+                    if doc_hash not in self._public:
+                        self._refs.setdefault(doc_hash, set()).add(tenant_id)
+                    self._tenant_docs.setdefault(tenant_id, set()).add(doc_hash)
+
+    def release(self, doc_hashes: Iterable[str], tenant_id: str) -> None:
+        """
+        Drop a tenant's references, deleting documents nobody references any more.
+
+        Args:
+            doc_hashes: Content hashes to release
+            tenant_id: Tenant releasing them
+        """
+        orphaned = []
+        with self._lock:
+            tenant_docs = self._tenant_docs.get(tenant_id, set())
+            for doc_hash in list(doc_hashes):
+                tenant_docs.discard(doc_hash)
+                holders = self._refs.get(doc_hash)
+                if holders is None:
+                    continue
+                holders.discard(tenant_id)
+                if not holders:
+                    del self._refs[doc_hash]
+                    orphaned.append(doc_hash)
+            if not tenant_docs:
+                self._tenant_docs.pop(tenant_id, None)
+            if orphaned:
+                self.store.remove_by_metadata("doc_hash", orphaned)
+
+    def public_sources(self) -> Dict[str, str]:
+        """
+        Get the public documents.
+
+        Returns:
+            Dictionary mapping content hash to source name
+        """
+        with self._lock:
+            return dict(self._public_sources)
+
+    def tenant_usage(self, tenant_id: str) -> Dict[str, int]:
+        """
+        Measure what a tenant's uploads cost in the shared index.
+
+        Private documents are those referenced by this tenant alone; they are what
+        releasing the tenant would free.
+
+        Args:
+            tenant_id: Tenant to measure
+
+        Returns:
+            Dictionary with documents, private documents, private chunks and the
+            approximate bytes held by private vectors and text
+        """
+        with self._lock:
+            documents = set(self._tenant_docs.get(tenant_id, set()))
+            private = {doc_hash for doc_hash in documents if self._refs.get(doc_hash) == {tenant_id}}
+
+        chunks, text_bytes = 0, 0
+        if private:
+            for doc in list(self.store.documents):
+                if doc.metadata.get("doc_hash") in private:
+                    chunks += 1
+                    text_bytes += len(doc.page_content)
+        return {
+            "documents": len(documents),
+            "private_documents": len(private),
+            "private_chunks": chunks,
+            "private_bytes": chunks * self.store.embedding_dim * 4 + text_bytes,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get sharing statistics for the collection.
+
+        Returns:
+            Dictionary with unique documents, vectors, tenants and total references
+        """
+        with self._lock:
+            return {
+                "unique_documents": len(self._refs) + len(self._public),
+                "public_documents": len(self._public),
+                "vectors": self.store.index.ntotal,
+                "tenants": len(self._tenant_docs),
+                "references": sum(len(docs) for docs in self._tenant_docs.values()),
+            }
+
+
+def _assign_content_hashes(documents: List[Document]) -> None:
+    """
+    Give chunks without a doc_hash one derived from the content of their file.
+
+    Chunks are grouped by source and each group is hashed over its chunks' text, so
+    two different files uploaded under the same name never count as one document.
+
+    Args:
+        documents: Chunks to update in place
+    """
+    groups: Dict[str, List[Document]] = {}
+    for doc in documents:
+        if "doc_hash" not in doc.metadata:
+            groups.setdefault(doc.metadata.get("source", "unknown"), []).append(doc)
+    for group in groups.values():
+        digest = hashlib.sha256()
+        for doc in group:
+            digest.update(doc.page_content.encode("utf-8"))
+            digest.update(b"\0")
+        doc_hash = "content:" + digest.hexdigest()
+        for doc in group:
+            doc.metadata["doc_hash"] = doc_hash
+
+
+def _doc_hash(doc: Document) -> str:
+    """Get a chunk's document hash (assigned on ingestion or by _assign_content_hashes)."""
+    doc_hash = doc.metadata.get("doc_hash")
+    if doc_hash is None:
+        raise ValueError(f"Chunk of {doc.metadata.get('source', 'unknown')} has no doc_hash")
+    return doc_hash
+
+
+class TenantView:
+    """
+    One tenant's scoped view of a collection.
+
+    Exposes the same interface the app, chatbot, cache and ingestion queue use on
+    FAISSVectorStore, but every search is restricted to the documents this tenant
+    may see, and clear() only releases this tenant's references. Once close() is
+    called (the session is gone) the view rejects new documents, so an ingestion job
+    finishing late can't leave references nobody will ever release.
+    """
+
+    def __init__(self, collection: Collection, tenant_id: str):
+        """
+        Initialize the tenant view.
+
+        Args:
+            collection: Collection to view
+            tenant_id: Tenant using the view
+        """
+        if not collection.can_access(tenant_id):
+            raise PermissionError(f"Tenant {tenant_id} cannot access collection {collection.name}")
+        self.collection = collection
+        self.tenant_id = tenant_id
+        self.store = collection.store
+        self._sources: Dict[str, str] = {}
+        self._view_version = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        """Embedding model currently serving the collection."""
+        return self.store.model_name
+
+    @property
+    def embedding_dim(self) -> int:
+        """Dimension of the collection's current embedding model."""
+        return self.store.embedding_dim
+
+    @property
+    def version(self):
+        """
+        Changes whenever the documents this tenant can see or the embedding model change.
+
+        Other tenants' private uploads don't affect it, so they don't invalidate this
+        tenant's cached answers.
+        """
+        return (self.store.model_name, self._view_version, self.collection.public_version)
+
+    def _doc_filter(self, source_filter: Optional[str] = None):
+        """Build a predicate limiting results to this tenant's documents."""
+        visible = self.collection.visible_hashes(self.tenant_id)
+        if source_filter is not None:
+            if source_filter in self._sources:
+                wanted = {self._sources[source_filter]}
+            else:
+                # Public documents are listed under their own source names
+                wanted = {
+                    doc_hash for doc_hash, source in self.collection.public_sources().items()
+                    if source == source_filter
+                }
+            visible = wanted & visible
+        return lambda doc: doc.metadata.get("doc_hash") in visible
+
+    def _relabel(self, documents: List[Document]) -> List[Document]:
+        """Show results under the name this tenant uploaded them as."""
+        names = {doc_hash: source for source, doc_hash in self._sources.items()}
+        relabelled = []
+        for doc in documents:
+            name = names.get(doc.metadata.get("doc_hash"))
+            if name and name != doc.metadata.get("source"):
+                doc = Document(page_content=doc.page_content, metadata={**doc.metadata, "source": name})
+            relabelled.append(doc)
+        return relabelled
+
+    def embed_documents(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embed texts with the collection's shared model."""
+        return self.store.embed_documents(texts, batch_size=batch_size)
+
+    def attach_document(self, doc_hash: str, source: str) -> bool:
+        """
+        Reference an already-indexed document instead of re-embedding it.
+
+        Args:
+            doc_hash: Content hash of the uploaded file
+            source: Name this tenant uploaded the file as
+
+        Returns:
+            True if the document was already indexed and is now visible to this tenant
+        """
+        with self._lock:
+            self._check_open()
+            if not self.collection.reference(doc_hash, self.tenant_id):
+                return False
+            self._sources[source] = doc_hash
+            self._view_version += 1
+        return True
+
+    def add_documents(self, documents: List[Document], embeddings: Optional[np.ndarray] = None,
+                      parents: Optional[List[Document]] = None, model_name: Optional[str] = None) -> None:
+        """
+        Add chunks for this tenant, embedding only content not yet in the collection.
+
+        Args:
+            documents: Chunks to add
+            embeddings: Optional precomputed embeddings, one row per document
+            parents: Optional parent sections referenced by the chunks
+            model_name: Model that produced the precomputed embeddings
+        """
+        if not documents:
+            return
+        # Held across the add so close() either sees these references or rejects them
+        with self._lock:
+            self._check_open()
+            self.collection.add_documents(documents, self.tenant_id, embeddings=embeddings, parents=parents,
+                                          model_name=model_name)
+            for doc in documents:
+                self._sources[doc.metadata.get("source", "unknown")] = _doc_hash(doc)
+            self._view_version += 1
+
+    def _check_open(self) -> None:
+        """Raise JobCancelled if the view was closed. Must be called with the view lock held."""
+        if self._closed:
+            raise JobCancelled(f"Tenant view for {self.tenant_id} was closed")
+
+    def get_parent(self, parent_id: int) -> Optional[Document]:
+        """Get the parent section of a retrieved child chunk."""
+        return self.store.get_parent(parent_id)
+
+    def similarity_search(self, query: str, k: int = 4, source_filter: str = None) -> List[Document]:
+        """Similarity search restricted to this tenant's documents."""
+        return self._relabel(self.store.similarity_search(query, k=k, doc_filter=self._doc_filter(source_filter)))
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4, source_filter: str = None) -> List[List[Document]]:
+        """Batched similarity search restricted to this tenant's documents."""
+        results = self.store.similarity_search_batch(queries, k=k, doc_filter=self._doc_filter(source_filter))
+        return [self._relabel(documents) for documents in results]
+
+    def similarity_search_multi(self, queries: List[str], k: int = 4, source_filter: str = None,
+                                fetch_k: int = None, weights: Sequence[float] = None,
+                                rrf_k: int = 60, mmr_lambda: Optional[float] = None) -> List[Document]:
+        """Multi-query search restricted to this tenant's documents."""
+        return self._relabel(self.store.similarity_search_multi(
+            queries, k=k, fetch_k=fetch_k, weights=weights, rrf_k=rrf_k,
+            doc_filter=self._doc_filter(source_filter), mmr_lambda=mmr_lambda
+        ))
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, source_filter: str = None) -> List[Document]:
+        """Diverse (MMR) search restricted to this tenant's documents."""
+        return self._relabel(self.store.max_marginal_relevance_search(
+            query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult,
+            doc_filter=self._doc_filter(source_filter)
+        ))
+
+    def get_document_sources(self) -> List[str]:
+        """
+        Get the names of the documents this tenant can see.
+
+        Returns:
+            Tenant's own document names plus public document sources
+        """
+        own_hashes = set(self._sources.values())
+        public_sources = {
+            source for doc_hash, source in self.collection.public_sources().items()
+            if doc_hash not in own_hashes
+        }
+        return sorted(set(self._sources) | public_sources)
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by documents only this tenant references."""
+        return self.collection.tenant_usage(self.tenant_id)["private_bytes"]
+
+    def remove_sources(self, sources: Iterable[str]) -> None:
+        """Release this tenant's references to the given documents."""
+        with self._lock:
+            hashes = [self._sources.pop(source) for source in list(sources) if source in self._sources]
+            self._view_version += 1
+        self.collection.release(hashes, self.tenant_id)
+
+    def clear(self) -> None:
+        """Release all of this tenant's documents; shared copies stay for other tenants."""
+        self.remove_sources(list(self._sources))
+
+    def close(self) -> None:
+        """Release all of this tenant's documents and reject any further adds."""
+        with self._lock:
+            self._closed = True
+        self.clear()
+
+
+class CollectionRegistry:
+    """
+    Process-level registry of named collections and the embedding models they use.
+
+    Create it once per server process (e.g. with st.cache_resource) and hand each
+    session a TenantView. Collections using the same model share one loaded copy
+    of it; a collection can be migrated to another model without downtime.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2",
+                 models: Optional[EmbeddingModelRegistry] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            model_name: Sentence transformer model for new collections
+            models: Model registry to load models from (default: the process-wide one)
+        """
+        self.model_name = model_name
+        self.models = models if models is not None else default_registry
+        self.model = self.models.get(model_name)
+        self.collections: Dict[str, Collection] = {}
+        self._lock = threading.Lock()
+
+    def create_collection(self, name: str, owner: Optional[str] = None,
+                          store: Optional[FAISSVectorStore] = None) -> Collection:
+        """
+        Create a named collection, or return it if it already exists.
+
+        Args:
+            name: Collection name
+            owner: Tenant that owns the collection, or None for a shared collection
+            store: Optional pre-populated store (e.g. a loaded snapshot) whose
+                   documents become public
+
+        Returns:
+            The Collection
+        """
+        with self._lock:
+            if name in self.collections:
+                return self.collections[name]
+            collection = Collection(
+                name,
+                store if store is not None else FAISSVectorStore(self.model_name, model=self.model),
+                owner=owner,
+                public_existing=store is not None,
+            )
+            self.collections[name] = collection
+            return collection
+
+    def load_collection(self, name: str, path: str) -> Collection:
+        """
+        Create a shared collection from a snapshot written by FAISSVectorStore.save().
+
+        Args:
+            name: Collection name
+            path: Snapshot directory
+
+        Returns:
+            The Collection, with every snapshot document public
+        """
+        if name in self.collections:
+            return self.collections[name]
+        snapshot_dir = FAISSVectorStore.snapshot_path(path)
+        if snapshot_dir is None:
+            raise FileNotFoundError(f"No vector store snapshot in {path}")
+        with open(os.path.join(snapshot_dir, "store.json"), "r", encoding="utf-8") as f:
+            snapshot_model = json.load(f)["model_name"]
+        store = FAISSVectorStore.load(path, model=self.models.get(snapshot_model))
+        return self.create_collection(name, store=store)
+
+    def migrate_collection(self, name: str, model_name: str, batch_size: int = 256) -> EmbeddingMigration:
+        """
+        Re-embed a collection with another model in the background.
+
+        The collection keeps answering queries with its current model until the
+        new index is complete, then switches atomically.
+
+        Args:
+            name: Collection name
+            model_name: Sentence transformer model to migrate to
+            batch_size: Number of chunks re-embedded per batch
+
+        Returns:
+            EmbeddingMigration tracking the progress
+        """
+        store = self.collections[name].store
+        return store.start_migration(model_name, model=self.models.get(model_name), batch_size=batch_size)
+
+    def get_collection(self, name: str, tenant_id: str) -> Collection:
+        """
+        Get a collection, checking the tenant may access it.
+
+        Args:
+            name: Collection name
+            tenant_id: Tenant requesting access
+
+        Returns:
+            The Collection
+
+        Raises:
+            KeyError: If the collection does not exist
+            PermissionError: If the tenant may not access it
+        """
+        collection = self.collections[name]
+        if not collection.can_access(tenant_id):
+            raise PermissionError(f"Tenant {tenant_id} cannot access collection {name}")
+        return collection
+
+    def view(self, name: str, tenant_id: str) -> TenantView:
+        """
+        Get a tenant's scoped view of a collection.
+
+        Args:
+            name: Collection name
+            tenant_id: Tenant using the view
+
+        Returns:
+            TenantView for the tenant
+        """
+        return TenantView(self.get_collection(name, tenant_id), tenant_id)
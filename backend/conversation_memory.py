@@ -0,0 +1,253 @@
+"""
+Conversation Memory Module
+
+This module keeps a bounded view of a chat so follow-up questions can be answered in
+context without resending the whole history. The last few turns are kept verbatim and
+everything older is folded into a rolling summary capped at a fixed token budget, so
+the per-turn prompt size stays constant however long the conversation runs. Folding
+with an LLM summarizer can run on a background thread so it never delays an answer.
+"""
+
+import re
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or its encoding files unavailable offline
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Number of tokens (approximated as characters / 4 without tiktoken)
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Truncate a text to a token budget.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Maximum number of tokens to keep
+        keep: "head" keeps the beginning of the text, "tail" keeps the end
+
+    Returns:
+        Truncated text
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text)
+        tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        text = _ENCODING.decode(tokens)
+    else:
+        text = text[:max_tokens * 4] if keep == "head" else text[-max_tokens * 4:]
+    return text + "..." if keep == "head" else "..." + text
+
+
+class ConversationMemory:
+    """
+    Bounded conversation history for follow-up questions.
+
+    Keeps the last `max_recent_turns` question/answer pairs verbatim (each message
+    truncated to `message_token_budget`) plus a rolling summary of older turns that
+    never exceeds `summary_token_budget`. Turns waiting to be folded are still shown
+    verbatim, so nothing drops out of the history while a summary is being written.
+    """
+
+    # Phrasings that only make sense by referring back to earlier turns. Deliberately
+    # narrow: a false positive costs an extra LLM call before every such answer
+    FOLLOW_UP_PATTERNS = [
+        # Pronouns that can only point back ("what is it used for?", "do they expire?")
+        r"\b(it|they|them)\b",
+        # Demonstratives standing alone ("what does that mean?"), not "this document"
+        r"(?:^|\b(?:is|was|are|were|does|did|do|about|explain|of|with|by))\s+(this|that|these|those)"
+        r"\s*(?:[?.!,]|$|\s+(?:is|was|are|were|mean|means|say|says|said)\b)",
+        # A person as the whole object ("tell me about her"), not "her skills"
+        r"\b(him|her)\s*[?.!]?\s*$",
+        r"\bthe (former|latter)\b|\bthe (first|second|third|last|other|same) ones?\b",
+        r"^\s*(and|also|but|what about|how about)\b",
+        r"\b(you|we) (mentioned|mention|said|say|discussed|listed)\b",
+        r"\b(above|previous|earlier|last) (answer|response|question|point|list)s?\b",
+        r"^\s*(tell me more|more|elaborate|go on|continue|why|what else)\s*[?.!]?\s*$",
+    ]
+
+    def __init__(self, max_recent_turns: int = 3, summary_token_budget: int = 300,
+                 message_token_budget: int = 250):
+        """
+        Initialize the conversation memory.
+
+        Args:
+            max_recent_turns: Number of recent question/answer pairs kept verbatim
+            summary_token_budget: Maximum size of the rolling summary in tokens
+            message_token_budget: Maximum size of each recent message in tokens
+        """
+        self.max_recent_turns = max_recent_turns
+        self.summary_token_budget = summary_token_budget
+        self.message_token_budget = message_token_budget
+        self.recent: deque = deque()
+        self.summary = ""
+        self.total_turns = 0
+        # Turns that fell out of `recent` but are not folded into the summary yet
+        self.pending: List[Tuple[str, str]] = []
+        self._folding: Optional[threading.Thread] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.follow_up_regex = [re.compile(pattern, re.IGNORECASE) for pattern in self.FOLLOW_UP_PATTERNS]
+
+    @property
+    def is_empty(self) -> bool:
+        """Whether no turns have been recorded yet."""
+        return not self.recent and not self.summary and not self.pending
+
+    def is_follow_up(self, question: str) -> bool:
+        """
+        Guess whether a question depends on earlier turns.
+
+        Args:
+            question: User's question
+
+        Returns:
+            True if the question likely refers back to the conversation
+        """
+        if self.is_empty:
+            return False
+        return any(pattern.search(question) for pattern in self.follow_up_regex)
+
+    def add_turn(self, question: str, answer: str,
+                 summarizer: Optional[Callable[[str, str, int], str]] = None,
+                 background: bool = False) -> None:
+        """
+        Record a question/answer pair, folding the oldest turn into the summary if needed.
+
+        Args:
+            question: User's question
+            answer: Assistant's answer
+            summarizer: Optional callable (summary, new_lines, token_budget) -> new summary,
+                        e.g. an LLM summarizer; falls back to extractive folding
+            background: Run the summarizer on a background thread instead of blocking
+                        (turns awaiting it stay in the history verbatim)
+        """
+        with self._lock:
+            self.recent.append((
+                truncate_tokens(question, self.message_token_budget),
+                truncate_tokens(answer, self.message_token_budget),
+            ))
+            self.total_turns += 1
+
+            while len(self.recent) > self.max_recent_turns:
+                self.pending.append(self.recent.popleft())
+            if not self.pending or self._folding is not None:
+                # A running background fold picks up turns added while it runs
+                return
+            generation = self._generation
+
+            if background and summarizer is not None:
+                self._folding = threading.Thread(
+                    target=self._fold_pending, args=(summarizer, generation), daemon=True
+                )
+                self._folding.start()
+                return
+
+        self._fold_pending(summarizer, generation)
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait for a background fold to finish.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+        """
+        folding = self._folding
+        if folding is not None:
+            folding.join(timeout)
+
+    def _fold_pending(self, summarizer: Optional[Callable[[str, str, int], str]], generation: int) -> None:
+        """Fold pending turns into the summary until none are left."""
+        while True:
+            with self._lock:
+                if generation != self._generation:
+                    # Cleared while folding
+                    return
+                turns = list(self.pending)
+                if not turns:
+                    self._folding = None
+                    return
+                summary = self.summary
+
+            # The summarizer (possibly an LLM call) runs without holding the lock
+            summary = self._summarize(summary, turns, summarizer)
+
+            with self._lock:
+                if generation != self._generation:
+                    return
+                del self.pending[:len(turns)]
+                self.summary = summary
+
+    def _summarize(self, summary: str, turns: List[Tuple[str, str]],
+                   summarizer: Optional[Callable[[str, str, int], str]]) -> str:
+        """Merge old turns into a rolling summary within the token budget."""
+        new_lines = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in turns)
+
+        new_summary = None
+        if summarizer is not None:
+            try:
+                new_summary = summarizer(summary, new_lines, self.summary_token_budget)
+            except Exception:
+                new_summary = None
+
+        if not new_summary:
+            # Extractive fallback: keep each question and the first sentence of its answer
+            facts = []
+            for q, a in turns:
+                first_sentence = re.split(r"(?<=[.!?])\s", a.strip(), maxsplit=1)[0]
+                facts.append(f"- User asked: {q.strip()} -> {first_sentence}")
+            new_summary = "\n".join(filter(None, [summary] + facts))
+
+        # Keep the most recent part of the summary if it is still too long
+        return truncate_tokens(new_summary.strip(), self.summary_token_budget, keep="tail")
+
+    def format_history(self) -> str:
+        """
+        Format the summary and recent turns for inclusion in a prompt.
+
+        Returns:
+            History string of bounded size (empty if nothing was recorded)
+        """
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation:\n{self.summary}")
+            for question, answer in self.pending + list(self.recent):
+                parts.append(f"User: {question}\nAssistant: {answer}")
+            return "\n\n".join(parts)
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the summary and recent turns."""
+        with self._lock:
+            turns = self.pending + list(self.recent)
+            return len(self.summary) + sum(len(q) + len(a) for q, a in turns)
+
+    def clear(self) -> None:
+        """Forget the conversation (a background fold still running is discarded)."""
+        with self._lock:
+            self.recent.clear()
+            self.pending = []
+            self.summary = ""
+            self.total_turns = 0
+            self._generation += 1
+            self._folding = None
@@ -1,5 +1,6 @@
 import os
-from typing import List, Dict
+import hashlib
+from typing import List, Dict, Tuple, Optional
 import pypdf
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
@@ -7,22 +8,41 @@ from langchain.schema.document import Document
 class DocumentProcessor:
     """Class for processing PDF documents and chunking text."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 child_chunk_size: Optional[int] = None, child_chunk_overlap: int = 50):
         """
         Initialize the document processor.
         
         Args:
-            chunk_size: Size of text chunks
+            chunk_size: Size of text chunks (parent sections when child_chunk_size is set)
             chunk_overlap: Overlap between chunks
+            child_chunk_size: If set, each chunk is further split into small child
+                              chunks of this size for small-to-big retrieval
+            child_chunk_overlap: Overlap between child chunks
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.child_chunk_size = child_chunk_size
+        self.child_chunk_overlap = child_chunk_overlap
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=len,
             is_separator_regex=False,
         )
+        self.child_splitter = None
+        if child_chunk_size:
+            self.child_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=child_chunk_size,
+                chunk_overlap=child_chunk_overlap,
+                length_function=len,
+                is_separator_regex=False,
+            )
+    
+    @property
+    def hierarchical(self) -> bool:
+        """Whether this processor produces parent/child chunk hierarchies."""
+        return self.child_splitter is not None
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
@@ -46,6 +66,24 @@ class DocumentProcessor:
         
         return text
     
+    @staticmethod
+    def hash_file(path: str, block_size: int = 1 << 20) -> str:
+        """
+        Compute the SHA-256 hash of a file's contents.
+        
+        Args:
+            path: Path to the file
+            block_size: Number of bytes read at a time
+            
+        Returns:
+            Hex digest of the file contents
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
     def chunk_text(self, text: str) -> List[Document]:
         """
         Split text into chunks for processing.
@@ -83,3 +121,35 @@ class DocumentProcessor:
             })
         
         return chunks
+    
+    def process_pdf_hierarchical(self, pdf_path: str, original_filename: str = None) -> Tuple[List[Document], List[Document]]:
+        """
+        Process a PDF file into parent sections and small child chunks.
+        
+        Child chunks are what gets embedded, for precise matching; each carries the
+        position of its parent section in "parent_index" so the full section can be
+        used as context once the child is retrieved.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            original_filename: Original filename to use as source (instead of temp filename)
+            
+        Returns:
+            Tuple of (parent Documents, child Documents)
+        """
+        if not self.hierarchical:
+            raise ValueError("child_chunk_size must be set for hierarchical processing")
+        
+        parents = self.process_pdf(pdf_path, original_filename)
+        
+        children = []
+        for parent_index, parent in enumerate(parents):
+            for child in self.child_splitter.create_documents([parent.page_content]):
+                child.metadata.update({
+                    "source": parent.metadata["source"],
+                    "chunk_id": len(children),
+                    "parent_index": parent_index
+                })
+                children.append(child)
+        
+        return parents, children
@@ -0,0 +1,100 @@
+"""
+Embedding Model Registry
+
+This module loads sentence transformer models once per process and hands the same
+instance to every store, collection and cache that asks for it by name. Several models
+can be resident at once, which is what lets a store keep serving queries with its
+current model while it re-embeds its documents with a new one.
+"""
+
+import threading
+from typing import Dict, List
+
+from sentence_transformers import SentenceTransformer
+
+
+class EmbeddingModelRegistry:
+    """
+    Process-wide cache of loaded embedding models, keyed by model name.
+
+    Models are loaded lazily on first use; concurrent requests for the same model
+    wait for a single load instead of loading the weights twice.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> SentenceTransformer:
+        """
+        Get a model, loading it on first use.
+
+        Args:
+            model_name: Sentence transformer model name
+
+        Returns:
+            The shared model instance
+        """
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if model_name in self._models:
+                    return self._models[model_name]
+            model = SentenceTransformer(model_name)
+            with self._lock:
+                self._models[model_name] = model
+            return model
+
+    def dimension(self, model_name: str) -> int:
+        """
+        Get the embedding dimension of a model.
+
+        Args:
+            model_name: Sentence transformer model name
+
+        Returns:
+            Number of dimensions the model embeds into
+        """
+        return self.get(model_name).get_sentence_embedding_dimension()
+
+    def loaded_models(self) -> List[str]:
+        """Names of the models currently in memory."""
+        with self._lock:
+            return list(self._models)
+
+    def release(self, model_name: str) -> None:
+        """
+        Drop a model from the registry (e.g. the old model after a migration).
+
+        Stores still holding the instance keep it alive until they let go of it.
+
+        Args:
+            model_name: Sentence transformer model name
+        """
+        with self._lock:
+            self._models.pop(model_name, None)
+            self._load_locks.pop(model_name, None)
+
+
+# Shared by every store in the process
+default_registry = EmbeddingModelRegistry()
+
+
+def get_model(model_name: str) -> SentenceTransformer:
+    """
+    Get a model from the process-wide registry.
+
+    Args:
+        model_name: Sentence transformer model name
+
+    Returns:
+        The shared model instance
+    """
+    return default_registry.get(model_name)
@@ -0,0 +1,189 @@
+"""
+Extractive Fast-Path Answers
+
+This module answers direct lookup questions ("what is the email in the resume?",
+"what's the policy number?") straight from the retrieved chunks with pattern
+extraction, without an LLM call. Each answer carries a confidence score; the chatbot
+only uses it above a threshold and falls back to LLM generation otherwise.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema.document import Document
+
+EMAIL_REGEX = r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}"
+PHONE_REGEX = r"(?<!\w)(?:\+?\d{1,3}[\s.\-]?)?(?:\(\d{2,4}\)[\s.\-]?)?\d{3,5}[\s.\-]?\d{3,4}(?:[\s.\-]?\d{2,4})?(?!\w)"
+URL_REGEX = r"(?:https?://|www\.)[^\s<>()\"']+|(?:linkedin\.com|github\.com)/[^\s<>()\"']+"
+DATE_REGEX = (
+    r"\b(?:\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}|\d{4}-\d{2}-\d{2}|"
+    r"(?:\d{1,2}\s+)?(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\.?\s+(?:\d{1,2},?\s+)?\d{4})\b"
+)
+
+
+class ExtractiveAnswer:
+    """A span extracted from a document, with its confidence."""
+
+    def __init__(self, answer: str, confidence: float, source: str, intent: str):
+        self.answer = answer
+        self.confidence = confidence
+        self.source = source
+        self.intent = intent
+
+    def format(self) -> str:
+        """Format the answer for display."""
+        return f"**{self.answer}** (from {self.source})"
+
+
+class ExtractiveAnswerer:
+    """
+    Pattern-based answer extraction for lookup questions.
+
+    Two kinds of lookups are recognised:
+    - Typed entities: emails, phone numbers, URLs and dates, detected from the
+      question wording and extracted with regular expressions.
+    - Labelled fields: "what is the <label>?" answered from a "<label>: value"
+      line in the text (policy numbers, names, addresses, IDs, ...).
+
+    Confidence is the intent's base confidence scaled by how dominant the best
+    value is among all candidates (weighted by retrieval rank), so ambiguous
+    lookups with several competing values fall below the threshold.
+    """
+
+    # intent -> (question pattern, value pattern, base confidence)
+    TYPED_INTENTS: Dict[str, Tuple[str, str, float]] = {
+        "email": (r"\be-?mail", EMAIL_REGEX, 0.95),
+        "phone": (r"\b(phone|mobile|cell|telephone|contact number)\b", PHONE_REGEX, 0.9),
+        "url": (r"\b(website|url|link|linkedin|github|portfolio|homepage)\b", URL_REGEX, 0.9),
+        "date": (r"\b(what date|which date|date of|dob|deadline|expir\w*|effective date|due date)\b", DATE_REGEX, 0.85),
+    }
+
+    # Questions that ask for explanation rather than a lookup
+    NON_LOOKUP_REGEX = re.compile(r"\b(why|how (do|does|did|can|should|would)|explain|describe|summar|compare|difference|better)\b", re.IGNORECASE)
+
+    LABEL_QUESTION_REGEX = re.compile(
+        r"^\s*(?:what(?:'s| is| are)|give me|tell me|find)\s+(?:the\s+|my\s+|his\s+|her\s+|their\s+|its\s+)?"
+        r"(?P<label>[\w\s\-#]{2,40}?)"
+        r"(?:\s+(?:in|on|of|from|for)\s+(?:the\s+|this\s+|my\s+)?[\w.\-]+(?:\s+\w+)?)?\s*\??\s*$",
+        re.IGNORECASE,
+    )
+
+    # Labelled-field lookups only cover identifier-like fields; open questions such as
+    # "what is her experience?" need the LLM even if the text has an "Experience:" line
+    IDENTIFIER_LABEL_REGEX = re.compile(
+        r"\b(number|no|id|code|name|address|reference|ref|account|policy|invoice|serial|"
+        r"zip|postcode|postal code|title|owner|holder|insurer|employer|company)$",
+        re.IGNORECASE,
+    )
+
+    # Values that are really the first item of a list, not a field value
+    BULLET_REGEX = re.compile(r"^[-*\u2022\u25aa\u25e6\u2013]\s")
+
+    def __init__(self, min_confidence: float = 0.75):
+        """
+        Initialize the extractive answerer.
+
+        Args:
+            min_confidence: Minimum confidence for an answer to be returned
+        """
+        self.min_confidence = min_confidence
+        self.typed_regex = {
+            intent: (re.compile(question, re.IGNORECASE), re.compile(value), base)
+            for intent, (question, value, base) in self.TYPED_INTENTS.items()
+        }
+
+    def detect_intent(self, question: str) -> Optional[str]:
+        """
+        Detect which kind of lookup a question is.
+
+        Args:
+            question: User's question
+
+        Returns:
+            Typed intent name, "label" for a labelled-field lookup, or None
+        """
+        if self.NON_LOOKUP_REGEX.search(question):
+            return None
+        for intent, (question_regex, _, _) in self.typed_regex.items():
+            if question_regex.search(question):
+                return intent
+        match = self.LABEL_QUESTION_REGEX.match(question)
+        if match and self.IDENTIFIER_LABEL_REGEX.search(match.group("label").strip()):
+            return "label"
+        return None
+
+    def _typed_candidates(self, intent: str, question: str,
+                          documents: List[Document]) -> List[Tuple[str, float, str]]:
+        """Find typed entity values, weighted by rank and keyword context."""
+        _, value_regex, _ = self.typed_regex[intent]
+        keywords = {word for word in re.findall(r"\w{3,}", question.lower())}
+        candidates = []
+        for rank, doc in enumerate(documents):
+            for line in doc.page_content.splitlines():
+                for match in value_regex.finditer(line):
+                    value = match.group(0).strip().rstrip(".,;")
+                    if intent == "phone" and len(re.sub(r"\D", "", value)) < 7:
+                        continue
+                    weight = 1.0 / (1 + rank)
+                    # Prefer values whose line (or the value itself) mentions question words,
+                    # e.g. "LinkedIn: ..." for "what's her linkedin?"
+                    if keywords & set(re.findall(r"\w{3,}", line.lower())):
+                        weight *= 2
+                    candidates.append((value, weight, doc.metadata.get("source", "Unknown source")))
+        return candidates
+
+    def _label_candidates(self, question: str, documents: List[Document]) -> List[Tuple[str, float, str]]:
+        """Find "<label>: value" lines matching the label asked about, value on the same line."""
+        match = self.LABEL_QUESTION_REGEX.match(question)
+        label = match.group("label").strip()
+        label_regex = re.compile(
+            rf"(?:^|\b){re.escape(label)}s?\b[ \t]*(?:no\.?|number|#)?[ \t]*[:#\-][ \t]*(?P<value>[^\n]{{1,80}})",
+            re.IGNORECASE,
+        )
+        candidates = []
+        for rank, doc in enumerate(documents):
+            for value_match in label_regex.finditer(doc.page_content):
+                value = value_match.group("value").strip().rstrip(".,;")
+                if value and not self.BULLET_REGEX.match(value):
+                    candidates.append((value, 1.0 / (1 + rank), doc.metadata.get("source", "Unknown source")))
+        return candidates
+
+    def extract(self, question: str, documents: List[Document]) -> Optional[ExtractiveAnswer]:
+        """
+        Try to answer a lookup question directly from documents.
+
+        Args:
+            question: User's question
+            documents: Retrieved documents, best match first
+
+        Returns:
+            ExtractiveAnswer if a value was found with enough confidence, else None
+        """
+        intent = self.detect_intent(question)
+        if intent is None or not documents:
+            return None
+
+        if intent == "label":
+            candidates = self._label_candidates(question, documents)
+            base_confidence = 0.85
+        else:
+            candidates = self._typed_candidates(intent, question, documents)
+            base_confidence = self.typed_regex[intent][2]
+        if not candidates:
+            return None
+
+        # Aggregate evidence per normalized value
+        scores: Dict[str, float] = {}
+        display: Dict[str, Tuple[str, str]] = {}
+        for value, weight, source in candidates:
+            key = re.sub(r"\s+", " ", value.lower())
+            scores[key] = scores.get(key, 0.0) + weight
+            display.setdefault(key, (value, source))
+
+        best = max(scores, key=scores.get)
+        confidence = base_confidence * scores[best] / sum(scores.values())
+        if confidence < self.min_confidence:
+            return None
+
+        value, source = display[best]
+        return ExtractiveAnswer(value, confidence, source, intent)
@@ -0,0 +1,296 @@
+"""
+Background Ingestion Queue
+
+This module runs PDF processing and embedding on a small pool of worker threads so
+that uploads never block the Streamlit script. Each uploaded file becomes a job with
+its own status and progress, and its chunks are added to the vector store as soon as
+that file finishes, so chat keeps working against already-indexed content.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.document_processor import DocumentProcessor
+
+
+class JobStatus:
+    """Possible states of an ingestion job."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class IngestionJob:
+    """State of a single file being ingested."""
+
+    def __init__(self, filename: str, pdf_path: str, cleanup: bool = True):
+        """
+        Initialize an ingestion job.
+
+        Args:
+            filename: Original filename, used as the document source
+            pdf_path: Path to the PDF file on disk
+            cleanup: Whether to delete the PDF file once the job finishes
+        """
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.pdf_path = pdf_path
+        self.cleanup = cleanup
+        self.status = JobStatus.QUEUED
+        self.progress = 0.0
+        self.stage = "Waiting"
+        self.error: Optional[str] = None
+        self.num_chunks = 0
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether the job has reached a terminal state."""
+        return self.status in JobStatus.FINISHED
+
+    @property
+    def cancel_requested(self) -> bool:
+        """Whether cancellation has been requested for this job."""
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> Dict:
+        """Return a serializable snapshot of the job state."""
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "error": self.error,
+            "num_chunks": self.num_chunks,
+        }
+
+
+class IngestionQueue:
+    """
+    Bounded-concurrency job queue for ingesting PDFs into a vector store.
+
+    Workers extract and chunk the PDF, embed the chunks in batches (reporting
+    progress after each batch) and then add the whole file to the store in one
+    step, so a file is either fully searchable or not at all.
+    """
+
+    def __init__(self, vector_store, document_processor: DocumentProcessor,
+                 max_workers: int = 2, embed_batch_size: int = 64):
+        """
+        Initialize the ingestion queue.
+
+        Args:
+            vector_store: Vector store that receives the processed documents
+            document_processor: Processor used to extract and chunk PDFs
+            max_workers: Maximum number of files processed concurrently
+            embed_batch_size: Number of chunks embedded per batch
+        """
+        self.vector_store = vector_store
+        self.document_processor = document_processor
+        self.embed_batch_size = embed_batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, pdf_path: str, cleanup: bool = True) -> IngestionJob:
+        """
+        Queue a PDF file for background ingestion.
+
+        Args:
+            filename: Original filename, used as the document source
+            pdf_path: Path to the PDF file on disk
+            cleanup: Whether to delete the PDF file once the job finishes
+
+        Returns:
+            The created IngestionJob
+        """
+        job = IngestionJob(filename, pdf_path, cleanup=cleanup)
+        with self._lock:
+            self.jobs[job.job_id] = job
+        job.future = self.executor.submit(self._run_job, job)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        Queued jobs are removed from the pool immediately; running jobs stop at
+        the next batch boundary and never reach the vector store.
+
+        Args:
+            job_id: ID of the job to cancel
+
+        Returns:
+            True if the job was still active and has been cancelled
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+
+        job._cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, JobStatus.CANCELLED, "Cancelled")
+        return True
+
+    def cancel_all(self, wait: bool = False) -> None:
+        """
+        Cancel every job that has not finished yet.
+
+        Args:
+            wait: Whether to wait until running jobs have stopped; a job already
+                  indexing finishes its add first, so the store is quiet afterwards
+        """
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            self.cancel(job.job_id)
+        if wait:
+            wait_futures([job.future for job in jobs if job.future is not None])
+
+    def get_jobs(self) -> List[IngestionJob]:
+        """
+        Get all jobs in submission order.
+
+        Returns:
+            List of IngestionJob objects
+        """
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.submitted_at)
+
+    def active_jobs(self) -> List[IngestionJob]:
+        """
+        Get jobs that are queued or running.
+
+        Returns:
+            List of unfinished IngestionJob objects
+        """
+        return [job for job in self.get_jobs() if not job.is_finished]
+
+    def pop_finished(self) -> List[IngestionJob]:
+        """
+        Remove and return all finished jobs.
+
+        The UI calls this on every rerun to move completed files into its own
+        list of loaded documents.
+
+        Returns:
+            List of finished IngestionJob objects
+        """
+        with self._lock:
+            finished = [job for job in self.jobs.values() if job.is_finished]
+            for job in finished:
+                del self.jobs[job.job_id]
+        return sorted(finished, key=lambda job: job.submitted_at)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Cancel outstanding jobs and stop the worker pool.
+
+        Args:
+            wait: Whether to wait for running jobs to stop
+        """
+        self.cancel_all()
+        self.executor.shutdown(wait=wait)
+
+    def _run_job(self, job: IngestionJob) -> None:
+        """Process one job on a worker thread."""
+        try:
+            job.check_cancelled()
+            job.status = JobStatus.RUNNING
+            job.stage = "Hashing"
+
+            # Shared stores can reference an identical, already-embedded file
+            doc_hash = DocumentProcessor.hash_file(job.pdf_path)
+            if hasattr(self.vector_store, "attach_document") and \
+                    self.vector_store.attach_document(doc_hash, job.filename):
+                self._finish(job, JobStatus.DONE, "Already indexed")
+                return
+
+            job.stage = "Extracting text"
+            job.progress = 0.05
+
+            parents = None
+            if self.document_processor.hierarchical:
+                parents, documents = self.document_processor.process_pdf_hierarchical(
+                    pdf_path=job.pdf_path,
+                    original_filename=job.filename
+                )
+            else:
+                documents = self.document_processor.process_pdf(
+                    pdf_path=job.pdf_path,
+                    original_filename=job.filename
+                )
+            for doc in (parents or []) + documents:
+                doc.metadata["doc_hash"] = doc_hash
+            job.num_chunks = len(documents)
+            job.check_cancelled()
+
+            # Embed in batches so progress can be reported and cancellation honoured
+            job.stage = "Embedding"
+            job.progress = 0.1
+            texts = [doc.page_content for doc in documents]
+            model_name = getattr(self.vector_store, "model_name", None)
+            batches = []
+            start = 0
+            while start < len(texts):
+                batch = self.vector_store.embed_documents(texts[start:start + self.embed_batch_size])
+                job.check_cancelled()
+                current_model = getattr(self.vector_store, "model_name", None)
+                if current_model != model_name or (batches and batch.shape[1] != batches[0].shape[1]):
+                    # The store switched models mid-upload; don't mix vectors of both
+                    model_name, batches, start = current_model, [], 0
+                    continue
+                batches.append(batch)
+                start += self.embed_batch_size
+                job.progress = 0.1 + 0.85 * min(start, len(texts)) / len(texts)
+
+            if documents:
+                job.stage = "Indexing"
+                job.check_cancelled()
+                self.vector_store.add_documents(documents, embeddings=np.vstack(batches), parents=parents,
+                                                model_name=model_name)
+
+            self._finish(job, JobStatus.DONE, "Done")
+        except JobCancelled:
+            self._finish(job, JobStatus.CANCELLED, "Cancelled")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, JobStatus.FAILED, "Failed")
+        finally:
+            if job.cleanup and os.path.exists(job.pdf_path):
+                os.unlink(job.pdf_path)
+
+    def _finish(self, job: IngestionJob, status: str, stage: str) -> None:
+        """Move a job into a terminal state."""
+        job.status = status
+        job.stage = stage
+        if status == JobStatus.DONE:
+            job.progress = 1.0
+        job.finished_at = time.time()
+        if job.cleanup and status == JobStatus.CANCELLED and job.future is not None \
+                and job.future.cancelled() and os.path.exists(job.pdf_path):
+            # Cancelled before it ever started, so the worker won't clean up
+            os.unlink(job.pdf_path)
@@ -0,0 +1,438 @@
+"""
+LLM Provider Layer
+
+This module puts a small, pluggable interface between the chatbot and the language
+model. Providers turn a prompt string into a response string; ResilientLLM wraps any
+provider with per-call deadlines, exponential-backoff retries, optional hedged
+duplicate requests for tail latency, a circuit breaker and a fallback provider.
+StubProvider answers locally without network access so the whole pipeline can be run
+and load-tested offline.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional
+
+# Substrings of error messages that indicate a rate limit or a transient upstream failure
+RETRYABLE_ERROR_MARKERS = ("429", "resource exhausted", "resourceexhausted", "rate limit", "quota",
+                           "503", "unavailable", "deadline exceeded", "timeout", "timed out")
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call misses its deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker is rejecting calls."""
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised when no worker picks up an LLM call in time (a local backlog, not a provider failure)."""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether an LLM error is worth retrying after a backoff.
+
+    Args:
+        error: Exception raised by a provider
+
+    Returns:
+        True for timeouts, rate limits and transient upstream failures
+    """
+    if isinstance(error, (LLMTimeoutError, TimeoutError, ConnectionError)):
+        return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in RETRYABLE_ERROR_MARKERS)
+
+
+class LLMProvider:
+    """Base class for language model providers."""
+
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        """
+        Generate a response for a prompt.
+
+        Args:
+            prompt: Fully formatted prompt
+
+        Returns:
+            Response text
+        """
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through LangChain."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = "gemini-1.5-flash-002", api_key: Optional[str] = None,
+                 temperature: float = 0.3, max_output_tokens: int = 2048, timeout: Optional[float] = None):
+        """
+        Initialize the Gemini provider.
+
+        Args:
+            model_name: Name of the Gemini model to use
+            api_key: Google API key (defaults to the GOOGLE_API_KEY environment variable)
+            temperature: Sampling temperature
+            max_output_tokens: Maximum response length in tokens
+            timeout: Request timeout in seconds, so calls abandoned by a caller's deadline
+                     also end instead of holding a worker
+        """
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it in the .env file.")
+
+        self.model_name = model_name
+        self.llm = ChatGoogleGenerativeAI(
+            model=model_name,
+            google_api_key=api_key,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            timeout=timeout,
+        )
+
+    def generate(self, prompt: str) -> str:
+        return self.llm.invoke(prompt).content
+
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider for development and load testing.
+
+    Answers document questions extractively by returning the context sentences that
+    share the most words with the question. Optional artificial latency and failure
+    rate make it possible to exercise timeouts, retries and the circuit breaker.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0,
+                 failure_rate: float = 0.0, max_sentences: int = 3):
+        """
+        Initialize the stub provider.
+
+        Args:
+            latency: Base delay per call in seconds
+            latency_jitter: Extra random delay of up to this many seconds
+            failure_rate: Probability (0.0-1.0) of raising a simulated transient error
+            max_sentences: Maximum number of context sentences in an answer
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.max_sentences = max_sentences
+
+    @staticmethod
+    def _section(prompt: str, header: str) -> str:
+        """Extract the text under an upper-case prompt header such as 'QUESTION:'."""
+        match = re.search(rf"{header}:\s*\n(.*?)(?:\n\s*[A-Z][A-Z \-]+:\s*\n|\Z)", prompt, re.DOTALL)
+        return match.group(1).strip() if match else ""
+
+    def generate(self, prompt: str) -> str:
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + random.uniform(0, self.latency_jitter))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("503 UNAVAILABLE (simulated by StubProvider)")
+
+        follow_up = self._section(prompt, "FOLLOW-UP QUESTION")
+        if follow_up:
+            # Echo the follow-up itself, without the instructions after it
+            return follow_up.split("\n\n")[0].strip()
+
+        new_lines = self._section(prompt, "NEW LINES OF CONVERSATION")
+        if new_lines:
+            return " ".join(filter(None, [self._section(prompt, "CURRENT SUMMARY"), new_lines]))
+
+        question = self._section(prompt, "QUESTION")
+        context = self._section(prompt, "CONTEXT")
+        if not context:
+            return f"(offline stub) I can only answer questions about your documents. You asked: {question}"
+
+        question_words = set(re.findall(r"\w+", question.lower()))
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", context) if len(s.strip()) > 20]
+        ranked = sorted(sentences, key=lambda s: len(question_words & set(re.findall(r"\w+", s.lower()))), reverse=True)
+        best = [s for s in ranked[:self.max_sentences] if question_words & set(re.findall(r"\w+", s.lower()))]
+        if not best:
+            return "I don't have enough information to answer that question."
+        return "\n".join(f"- {sentence}" for sentence in best)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing provider for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are
+    rejected immediately. After `reset_timeout` seconds a single trial call is
+    allowed (half-open); its success closes the circuit, its failure reopens it.
+    A trial that never reached the provider is released without a verdict.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to wait before allowing a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_inconclusive(self) -> None:
+        """Release a half-open trial that never reached the provider, so the next call can try."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class _Call:
+    """One provider call submitted to a worker pool, recording when a worker picked it up."""
+
+    def __init__(self, executor: ThreadPoolExecutor, provider: LLMProvider, prompt: str):
+        self.started = threading.Event()
+        self.started_at = 0.0
+        self.future = executor.submit(self._run, provider, prompt)
+
+    def _run(self, provider: LLMProvider, prompt: str) -> str:
+        self.started_at = time.monotonic()
+        self.started.set()
+        return provider.generate(prompt)
+
+
+class ResilientLLM(LLMProvider):
+    """
+    Wraps a provider with deadlines, retries, hedging, a circuit breaker and a fallback.
+
+    Each attempt runs on a worker thread and is abandoned if it misses `timeout`,
+    counted from when a worker starts the call. Waiting for a free worker is bounded
+    by `queue_timeout` (and never longer than `timeout`); a call still queued after
+    it is cancelled and reported as LLMOverloadedError, which neither retries nor
+    counts against the circuit. Queue time always counts towards `deadline`.
+    With `hedge_after` set, a duplicate request is sent if the first has not
+    answered after that many seconds and whichever finishes first wins, which trims
+    tail latency at the cost of occasional extra calls. Rate-limited and transient
+    failures are retried with exponential backoff and full jitter, all within an
+    optional overall `deadline`.
+    """
+
+    def __init__(self, provider: LLMProvider, timeout: float = 30.0, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0, hedge_after: Optional[float] = None,
+                 deadline: Optional[float] = None, circuit_breaker: Optional[CircuitBreaker] = None,
+                 fallback: Optional[LLMProvider] = None, max_workers: int = 16,
+                 queue_timeout: Optional[float] = None):
+        """
+        Initialize the resilient wrapper.
+
+        Args:
+            provider: Provider to wrap
+            timeout: Deadline for a single attempt in seconds
+            max_retries: Retries after the first attempt for retryable errors
+            base_delay: Delay before the first retry in seconds; doubles every retry
+            max_delay: Upper bound on a single backoff delay in seconds
+            hedge_after: Seconds after which a duplicate request is sent (None disables hedging)
+            deadline: Overall time budget per generate() call, including retries
+            circuit_breaker: Optional circuit breaker shared by all calls
+            fallback: Optional provider used when the primary fails or the circuit is open
+            max_workers: Maximum concurrent in-flight attempts
+            queue_timeout: Seconds an attempt may wait for a free worker (default: timeout)
+        """
+        self.provider = provider
+        self.name = f"resilient({provider.name})"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self.circuit_breaker = circuit_breaker
+        self.fallback = fallback
+        self.queue_timeout = queue_timeout if queue_timeout is not None else timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+        # Metrics
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.timeouts = 0
+        self.queue_timeouts = 0
+        self.fallbacks = 0
+
+    def _attempt(self, prompt: str, timeout: float, deadline_at: Optional[float] = None) -> str:
+        """
+        Run one (possibly hedged) attempt within a deadline.
+
+        The call gets `timeout` from when a worker starts it; waiting for the worker
+        is bounded by min(queue_timeout, timeout). Both stay within `deadline_at`
+        (a time.monotonic() value), the end of the caller's overall budget.
+        """
+        queue_timeout = min(self.queue_timeout, timeout)
+        if deadline_at is not None:
+            queue_timeout = min(queue_timeout, max(0.0, deadline_at - time.monotonic()))
+        first = _Call(self._executor, self.provider, prompt)
+        if not first.started.wait(queue_timeout) and first.future.cancel():
+            self.queue_timeouts += 1
+            raise LLMOverloadedError(f"No LLM worker became free within {queue_timeout:.1f}s")
+        first.started.wait()
+        start = first.started_at
+        if deadline_at is not None:
+            # Queue time came out of the overall budget
+            timeout = min(timeout, deadline_at - start)
+        futures = {first.future}
+
+        if self.hedge_after is not None and self.hedge_after < timeout:
+            done, _ = wait(futures, timeout=max(0.0, start + self.hedge_after - time.monotonic()))
+            if not done:
+                self.hedges += 1
+                futures.add(_Call(self._executor, self.provider, prompt).future)
+
+        errors = []
+        while futures:
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, futures = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+
+        for future in futures:
+            # A hedge still waiting for a worker is no longer needed
+            future.cancel()
+        if errors and not futures:
+            raise errors[0]
+        self.timeouts += 1
+        raise LLMTimeoutError(f"LLM call timed out after {timeout:.1f}s")
+
+    def _generate_primary(self, prompt: str) -> str:
+        """Call the primary provider with retries inside the overall deadline."""
+        start = time.monotonic()
+        deadline_at = start + self.deadline if self.deadline is not None else None
+        for attempt in range(self.max_retries + 1):
+            timeout = self.timeout
+            if deadline_at is not None:
+                timeout = min(timeout, deadline_at - time.monotonic())
+                if timeout <= 0:
+                    raise LLMTimeoutError(f"LLM deadline of {self.deadline:.1f}s exceeded")
+            try:
+                return self._attempt(prompt, timeout, deadline_at)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                self.retries += 1
+                # Full jitter keeps parallel callers from retrying in lockstep
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if self.deadline is not None:
+                    delay = min(delay, max(0.0, self.deadline - (time.monotonic() - start)))
+                time.sleep(delay)
+
+    def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+            if self.fallback is not None:
+                self.fallbacks += 1
+                return self.fallback.generate(prompt)
+            raise CircuitOpenError(f"{self.provider.name} is unavailable (circuit open)")
+
+        try:
+            response = self._generate_primary(prompt)
+        except Exception as e:
+            if self.circuit_breaker is not None:
+                if isinstance(e, LLMOverloadedError):
+                    # The provider was never called; this says nothing about its health
+                    self.circuit_breaker.record_inconclusive()
+                else:
+                    self.circuit_breaker.record_failure()
+            if self.fallback is not None:
+                self.fallbacks += 1
+                return self.fallback.generate(prompt)
+            raise
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        return response
+
+    def stats(self) -> dict:
+        """
+        Get call metrics.
+
+        Returns:
+            Dictionary with calls, retries, hedges, timeouts, queue timeouts, fallbacks
+            and circuit state
+        """
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "timeouts": self.timeouts,
+            "queue_timeouts": self.queue_timeouts,
+            "fallbacks": self.fallbacks,
+            "circuit": self.circuit_breaker.state if self.circuit_breaker is not None else None,
+        }
+
+
+def create_llm(model_name: str = "gemini-1.5-flash-002", provider: Optional[str] = None, **kwargs) -> ResilientLLM:
+    """
+    Build the default resilient LLM client.
+
+    Args:
+        model_name: Gemini model name
+        provider: "gemini" or "stub" (defaults to the DOCUMIND_LLM_PROVIDER environment
+                  variable, then "gemini")
+        **kwargs: Extra ResilientLLM settings (timeout, max_retries, hedge_after, ...)
+
+    Returns:
+        ResilientLLM wrapping the selected provider, with a circuit breaker
+    """
+    provider = (provider or os.getenv("DOCUMIND_LLM_PROVIDER", "gemini")).lower()
+    if provider == "stub":
+        base = StubProvider()
+    elif provider == "gemini":
+        # End the HTTP request itself when an attempt's deadline passes
+        base = GeminiProvider(model_name=model_name, timeout=kwargs.get("timeout", 30.0))
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+    kwargs.setdefault("circuit_breaker", CircuitBreaker())
+    return ResilientLLM(base, **kwargs)
@@ -0,0 +1,174 @@
+"""
+Query Expansion Module
+
+This module rewrites a user question into several search queries so that retrieval
+can find chunks that phrase the same idea differently. Variants come from cheap local
+rewrites and, optionally, from a single LLM call that produces paraphrases and a
+hypothetical answer passage (HyDE). Every variant is then searched together with one
+batched encode and one multi-row FAISS search.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+from langchain.prompts import PromptTemplate
+
+from backend.llm_providers import ResilientLLM
+
+# Shared pool so a slow LLM expansion can be abandoned after its time budget
+_expansion_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-expansion")
+
+
+class QueryExpander:
+    """
+    Generates alternative search queries for a question.
+
+    Expansion is bounded per question: at most `max_variants` queries are returned
+    (including the original), at most one LLM call is made, and that call is
+    abandoned if it does not finish within `llm_timeout` seconds, in which case the
+    local rewrites are used on their own. The expander uses its own client for the
+    LLM's provider, without retries, hedging or the answer path's circuit breaker,
+    so an abandoned expansion ends with its budget and its failures don't take the
+    provider out of service for answers.
+    """
+
+    STOPWORDS = {
+        "a", "an", "the", "is", "are", "was", "were", "be", "been", "do", "does", "did",
+        "what", "who", "whom", "where", "when", "why", "how", "which", "can", "could",
+        "would", "should", "will", "please", "tell", "me", "about", "of", "in", "on",
+        "for", "to", "from", "with", "and", "or", "it", "its", "this", "that", "there",
+        "i", "you", "we", "they", "my", "your", "give", "show", "list", "explain",
+    }
+
+    def __init__(self, llm=None, use_llm_variants: bool = False, use_hyde: bool = False,
+                 max_variants: int = 4, llm_timeout: float = 3.0):
+        """
+        Initialize the query expander.
+
+        Args:
+            llm: Optional LLM provider (see backend.llm_providers) used for paraphrases and HyDE;
+                 a ResilientLLM is unwrapped to its provider
+            use_llm_variants: Whether to ask the LLM for paraphrased queries
+            use_hyde: Whether to ask the LLM for a hypothetical answer passage
+            max_variants: Maximum number of queries returned, including the original
+            llm_timeout: Seconds to wait for the LLM before falling back to local rewrites
+        """
+        if llm is not None:
+            provider = llm.provider if isinstance(llm, ResilientLLM) else llm
+            llm = ResilientLLM(provider, timeout=llm_timeout, deadline=llm_timeout, max_retries=0, max_workers=2)
+        self.llm = llm
+        self.use_llm_variants = use_llm_variants and llm is not None
+        self.use_hyde = use_hyde and llm is not None
+        self.max_variants = max(1, max_variants)
+        self.llm_timeout = llm_timeout
+
+        # Single prompt for paraphrases and the hypothetical answer so the
+        # expansion never costs more than one LLM round-trip
+        self.expansion_prompt = PromptTemplate(
+            input_variables=["question", "num_variants", "hyde_instruction"],
+            template="""
+            You help a search engine find passages in PDF documents.
+
+            QUESTION:
+            {question}
+
+            INSTRUCTIONS:
+            1. Write {num_variants} alternative search queries for the question, one per line, each starting with "Q:".
+            2. Use different wording and synonyms; keep each query short.
+            {hyde_instruction}
+
+            OUTPUT:
+            """
+        )
+
+    def local_rewrites(self, question: str) -> List[str]:
+        """
+        Produce rewrites of a question without calling an LLM.
+
+        Args:
+            question: User's question
+
+        Returns:
+            List of rewritten queries (may be empty)
+        """
+        rewrites = []
+
+        # Keyword-only variant: drop question words and stopwords
+        words = re.findall(r"[\w@.\-']+", question.lower())
+        keywords = [word for word in words if word not in self.STOPWORDS]
+        if keywords and len(keywords) < len(words):
+            rewrites.append(" ".join(keywords))
+
+        # Declarative variant: "what is X?" -> "X is"
+        match = re.match(r"^\s*(what|who|where|when)\s+(is|are|was|were)\s+(.+?)\??\s*$", question, re.IGNORECASE)
+        if match:
+            rewrites.append(f"{match.group(3)} {match.group(2).lower()}")
+
+        return rewrites
+
+    def llm_expansions(self, question: str, num_variants: int) -> List[str]:
+        """
+        Ask the LLM for paraphrased queries and/or a hypothetical answer.
+
+        Args:
+            question: User's question
+            num_variants: Number of paraphrases to request
+
+        Returns:
+            List of generated queries, hypothetical answer first (empty on failure or timeout)
+        """
+        if not (self.use_llm_variants or self.use_hyde):
+            return []
+
+        hyde_instruction = (
+            '3. Then write one short passage (2-3 sentences) that could plausibly answer the question, on a single line starting with "A:".'
+            if self.use_hyde else ""
+        )
+        prompt = self.expansion_prompt.format(
+            question=question,
+            num_variants=num_variants if self.use_llm_variants else 0,
+            hyde_instruction=hyde_instruction,
+        )
+
+        future = _expansion_executor.submit(self.llm.generate, prompt)
+        try:
+            response = future.result(timeout=self.llm_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return []
+        except Exception:
+            return []
+
+        paraphrases, hypothetical = [], []
+        for line in response.splitlines():
+            line = line.strip()
+            if line.startswith("Q:") and self.use_llm_variants:
+                paraphrases.append(line[2:].strip())
+            elif line.startswith("A:") and self.use_hyde:
+                hypothetical.append(line[2:].strip())
+
+        return hypothetical[:1] + paraphrases[:num_variants]
+
+    def expand(self, question: str) -> List[str]:
+        """
+        Expand a question into a bounded list of search queries.
+
+        Args:
+            question: User's question
+
+        Returns:
+            List of unique queries with the original question first
+        """
+        queries = [question]
+        budget = self.max_variants - 1
+        if budget > 0:
+            candidates = self.llm_expansions(question, budget) + self.local_rewrites(question)
+            seen = {question.strip().lower()}
+            for candidate in candidates:
+                key = candidate.strip().lower()
+                if key and key not in seen:
+                    seen.add(key)
+                    queries.append(candidate)
+
+        return queries[:self.max_variants]
@@ -1,11 +1,15 @@
-import os
-from typing import List, Dict, Any, Tuple
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterator
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain.schema.document import Document
-from langchain.schema.runnable import RunnablePassthrough
+from backend.conversation_memory import ConversationMemory
+from backend.extractive_qa import ExtractiveAnswerer
+from backend.llm_providers import LLMProvider, ResilientLLM, CircuitBreaker, create_llm
 from backend.ragate import RAGate
+from backend.query_expansion import QueryExpander
 
 # Load environment variables
 load_dotenv()
@@ -15,7 +19,16 @@ class RAGChatbot:
     
     def __init__(self, model_name: str = "gemini-1.5-flash-002", 
                  confidence_threshold: float = 0.7,
-                 use_ragate: bool = True):
+                 use_ragate: bool = True,
+                 query_expansion: str = "none",
+                 max_query_variants: int = 4,
+                 semantic_cache=None,
+                 mmr_lambda: Optional[float] = None,
+                 mmr_fetch_k: int = 20,
+                 parent_resolver: Optional[Callable[[int], Optional[Document]]] = None,
+                 llm: Optional[LLMProvider] = None,
+                 use_extractive: bool = False,
+                 extractive_threshold: float = 0.75):
         """
         Initialize the RAG chatbot.
         
@@ -23,33 +36,65 @@ class RAGChatbot:
             model_name: Name of the Gemini model to use
             confidence_threshold: Threshold for RAGate retrieval decision
             use_ragate: Whether to use the RAGate system for adaptive retrieval
+            query_expansion: Query expansion mode: "none", "local" (rule-based rewrites),
+                             "multi_query" (LLM paraphrases) or "hyde" (LLM paraphrases
+                             plus a hypothetical answer passage)
+            max_query_variants: Per-question cap on search queries, including the original
+            semantic_cache: Optional SemanticCache used to reuse answers to paraphrased questions
+            mmr_lambda: If set, retrieve a diverse top-k with Maximal Marginal Relevance
+                        (1.0 = pure relevance, 0.0 = maximum diversity)
+            mmr_fetch_k: Number of candidates MMR selects from
+            parent_resolver: Optional callable mapping a chunk's parent_id to its parent
+                             section (e.g. vector_store.get_parent) for small-to-big retrieval
+            llm: Optional LLM provider. Reuse one ResilientLLM across chatbots so its
+                 circuit breaker sees every call; plain providers are wrapped in one.
+                 Defaults to Gemini, or the offline stub if DOCUMIND_LLM_PROVIDER=stub
+            use_extractive: Whether to answer lookup questions (emails, dates, numbers,
+                            labelled fields) straight from the retrieved text without an LLM call
+            extractive_threshold: Minimum confidence for an extractive answer; below it
+                                  the question goes to the LLM as usual
         """
-        # Check if API key is available
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it in the .env file.")
-        
         # Initialize the RAGate system
         self.ragate = RAGate(confidence_threshold=confidence_threshold)
         self.use_ragate = use_ragate
+        self.semantic_cache = semantic_cache
+        self.mmr_lambda = mmr_lambda
+        self.mmr_fetch_k = mmr_fetch_k
+        self.parent_resolver = parent_resolver
+        self.extractive_answerer = ExtractiveAnswerer(min_confidence=extractive_threshold) if use_extractive else None
         
-        # Initialize the language model
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            google_api_key=self.api_key,
-            temperature=0.3,
-            max_output_tokens=2048,
-        )
+        # Initialize the language model behind the resilient provider layer
+        if llm is None:
+            self.llm = create_llm(model_name)
+        elif isinstance(llm, ResilientLLM):
+            self.llm = llm
+        else:
+            self.llm = ResilientLLM(llm, circuit_breaker=CircuitBreaker())
+        
+        # Initialize the optional query expander
+        if query_expansion not in ("none", "local", "multi_query", "hyde"):
+            raise ValueError(f"Unknown query expansion mode: {query_expansion}")
+        self.query_expander = None
+        if query_expansion != "none":
+            self.query_expander = QueryExpander(
+                llm=self.llm,
+                use_llm_variants=query_expansion in ("multi_query", "hyde"),
+                use_hyde=query_expansion == "hyde",
+                max_variants=max_query_variants,
+            )
         
         # Define the QA prompt template with document context
         self.qa_prompt = PromptTemplate(
-            input_variables=["context", "question"],
+            input_variables=["context", "question", "history"],
             template="""
             You are an intelligent assistant that answers questions based on provided context.
             
             CONTEXT:
             {context}
             
+            CONVERSATION SO FAR:
+            {history}
+            
             QUESTION:
             {question}
             
@@ -66,10 +111,13 @@ class RAGChatbot:
         
         # Define the direct answer prompt template (no document context)
         self.direct_prompt = PromptTemplate(
-            input_variables=["question"],
+            input_variables=["question", "history"],
             template="""
             You are an intelligent assistant that answers general questions and helps users with their PDF chatbot.
             
+            CONVERSATION SO FAR:
+            {history}
+            
             QUESTION:
             {question}
             
@@ -83,24 +131,65 @@ class RAGChatbot:
             """
         )
         
-        # Initialize the QA chain using the modern RunnableSequence approach
-        self.qa_chain = (
-            {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
-            | self.qa_prompt
-            | self.llm
+        # Define the prompt that turns a follow-up into a standalone search question
+        self.condense_prompt = PromptTemplate(
+            input_variables=["history", "question"],
+            template="""
+            Given the conversation below and a follow-up question, rewrite the follow-up
+            as a single standalone question that can be understood without the conversation.
+            
+            CONVERSATION:
+            {history}
+            
+            FOLLOW-UP QUESTION:
+            {question}
+            
+            Respond with the standalone question only.
+            
+            STANDALONE QUESTION:
+            """
         )
         
-        # Initialize the direct answer chain (no retrieval)
-        self.direct_chain = (
-            {"question": RunnablePassthrough()}
-            | self.direct_prompt
-            | self.llm
+        # Define the prompt that folds old turns into the rolling conversation summary
+        self.summary_prompt = PromptTemplate(
+            input_variables=["summary", "new_lines", "max_words"],
+            template="""
+            Progressively summarize a conversation between a user and a document assistant.
+            Keep names, numbers and document facts; drop pleasantries.
+            
+            CURRENT SUMMARY:
+            {summary}
+            
+            NEW LINES OF CONVERSATION:
+            {new_lines}
+            
+            Respond with the updated summary in at most {max_words} words.
+            
+            NEW SUMMARY:
+            """
         )
     
+    def _generate(self, prompt: PromptTemplate, **inputs) -> str:
+        """
+        Format a prompt and send it through the LLM provider layer.
+        
+        Args:
+            prompt: Prompt template to fill in
+            **inputs: Values for the template's input variables
+            
+        Returns:
+            Stripped response text
+        """
+        return self.llm.generate(prompt.format(**inputs)).strip()
+    
     def format_context(self, documents: List[Document]) -> str:
         """
         Format a list of documents into a context string.
         
+        Child chunks that belong to a parent section are replaced by that section,
+        and each section is included only once even if several of its children
+        were retrieved.
+        
         Args:
             documents: List of Document objects
             
@@ -108,12 +197,73 @@ class RAGChatbot:
             Formatted context string
         """
         context_parts = []
-        for i, doc in enumerate(documents):
+        seen_parents = set()
+        for doc in documents:
+            parent_id = doc.metadata.get("parent_id")
+            if parent_id is not None and self.parent_resolver is not None:
+                if parent_id in seen_parents:
+                    continue
+                seen_parents.add(parent_id)
+                parent = self.parent_resolver(parent_id)
+                if parent is not None:
+                    doc = Document(
+                        page_content=parent.page_content,
+                        metadata={**parent.metadata, "source": doc.metadata.get("source", "Unknown source")}
+                    )
+            
             source = doc.metadata.get("source", "Unknown source")
-            context_parts.append(f"Document {i+1} (from {source}):\n{doc.page_content}")
+            context_parts.append(f"Document {len(context_parts)+1} (from {source}):\n{doc.page_content}")
         
         return "\n\n".join(context_parts)
     
+    def retrieve(self, question: str, vector_store, k: int = 4, source_filter: str = None) -> List[Document]:
+        """
+        Retrieve relevant documents, expanding the query if enabled.
+        
+        With expansion enabled, all query variants are searched in one batch and
+        merged by rank fusion; otherwise this is a plain similarity search. With MMR
+        enabled, the final k are picked from a larger candidate set for diversity.
+        
+        Args:
+            question: User's question
+            vector_store: Vector store to search
+            k: Number of documents to return
+            source_filter: Optional document source to restrict the search to
+            
+        Returns:
+            List of relevant Document objects
+        """
+        queries = self.query_expander.expand(question) if self.query_expander is not None else [question]
+        
+        if len(queries) > 1:
+            if self.mmr_lambda is None:
+                return vector_store.similarity_search_multi(queries, k=k, source_filter=source_filter)
+            return vector_store.similarity_search_multi(
+                queries, k=k, source_filter=source_filter,
+                fetch_k=self.mmr_fetch_k, mmr_lambda=self.mmr_lambda
+            )
+        
+        if self.mmr_lambda is not None:
+            return vector_store.max_marginal_relevance_search(
+                question, k=k, fetch_k=self.mmr_fetch_k,
+                lambda_mult=self.mmr_lambda, source_filter=source_filter
+            )
+        return vector_store.similarity_search(question, k=k, source_filter=source_filter)
+    
+    def decide_retrieval_many(self, questions: List[str]) -> List[Tuple[bool, float]]:
+        """
+        Decide whether to use retrieval for many questions at once.
+        
+        Args:
+            questions: User questions
+            
+        Returns:
+            List of (use_retrieval, confidence) tuples, one per question
+        """
+        if not self.use_ragate:
+            return [(True, 1.0)] * len(questions)
+        return self.ragate.decide_many(questions)
+    
     def decide_retrieval(self, question: str) -> Tuple[bool, float, str]:
         """
         Decide whether to use retrieval for this question.
@@ -134,31 +284,96 @@ class RAGChatbot:
         
         return use_retrieval, confidence, explanation
     
-    def direct_answer(self, question: str) -> str:
+    def condense_question(self, question: str, memory: Optional[ConversationMemory] = None) -> str:
+        """
+        Rewrite a follow-up question into a standalone retrieval query.
+        
+        Only questions that look like follow-ups trigger the extra LLM call; others
+        are returned unchanged.
+        
+        Args:
+            question: User's question
+            memory: Conversation memory for the current chat
+            
+        Returns:
+            Standalone question
+        """
+        if memory is None or not memory.is_follow_up(question):
+            return question
+        
+        try:
+            standalone = self._generate(
+                self.condense_prompt,
+                history=memory.format_history(),
+                question=question
+            )
+            return standalone or question
+        except Exception:
+            return question
+    
+    def summarize_history(self, summary: str, new_lines: str, token_budget: int) -> str:
+        """
+        Fold new conversation lines into a rolling summary using the LLM.
+        
+        Args:
+            summary: Current summary
+            new_lines: Conversation lines to merge into it
+            token_budget: Target size of the summary in tokens
+            
+        Returns:
+            Updated summary
+        """
+        return self._generate(
+            self.summary_prompt,
+            summary=summary or "(empty)",
+            new_lines=new_lines,
+            # Roughly 3 words for every 4 tokens
+            max_words=max(20, token_budget * 3 // 4)
+        )
+    
+    def remember(self, memory: Optional[ConversationMemory], question: str, answer: str) -> None:
+        """
+        Record a finished turn in the conversation memory.
+        
+        Older turns are summarized on a background thread, so recording a turn
+        never waits for an LLM call.
+        
+        Args:
+            memory: Conversation memory for the current chat (ignored if None)
+            question: Question that was answered
+            answer: Answer that was given
+        """
+        if memory is not None:
+            memory.add_turn(question, answer, summarizer=self.summarize_history, background=True)
+    
+    def direct_answer(self, question: str, history: str = "") -> str:
         """
         Generate a direct answer without using document retrieval.
         
         Args:
             question: Question to answer
+            history: Formatted conversation history
             
         Returns:
             Direct answer (not using document context)
         """
         try:
-            response = self.direct_chain.invoke({
-                "question": question
-            })
-            return response.content.strip()
+            return self._generate(
+                self.direct_prompt,
+                question=question,
+                history=history or "(none)"
+            )
         except Exception as e:
             return f"Error generating response: {str(e)}"
     
-    def answer_with_retrieval(self, question: str, documents: List[Document]) -> str:
+    def answer_with_retrieval(self, question: str, documents: List[Document], history: str = "") -> str:
         """
         Answer a question using retrieved document context.
         
         Args:
             question: Question to answer
             documents: List of Document objects to use as context
+            history: Formatted conversation history
             
         Returns:
             Answer based on document context
@@ -169,25 +384,96 @@ class RAGChatbot:
         context = self.format_context(documents)
         
         try:
-            response = self.qa_chain.invoke({
-                "context": context,
-                "question": question
-            })
-            return response.content.strip()
+            return self._generate(
+                self.qa_prompt,
+                context=context,
+                question=question,
+                history=history or "(none)"
+            )
         except Exception as e:
             return f"Error generating response: {str(e)}"
     
-    def answer_question(self, question: str, documents: List[Document]) -> str:
+    def extractive_answer(self, question: str, documents: List[Document]) -> Optional[str]:
+        """
+        Answer a lookup question by extracting the value from the documents, without the LLM.
+        
+        Args:
+            question: Question to answer
+            documents: Retrieved documents, best match first
+            
+        Returns:
+            Formatted answer, or None if extraction is disabled or not confident enough
+        """
+        if self.extractive_answerer is None:
+            return None
+        extracted = self.extractive_answerer.extract(question, documents)
+        return extracted.format() if extracted is not None else None
+    
+    @staticmethod
+    def depends_on_history(question: str, memory: Optional[ConversationMemory]) -> bool:
+        """
+        Check whether a question still needs the conversation to make sense.
+        
+        True for follow-ups that condense_question could not turn into a standalone
+        question (e.g. "tell me more"); their answers are shaped by the history, so
+        they are neither served from nor stored in the semantic cache.
+        
+        Args:
+            question: Question as it will be answered (after condensing)
+            memory: Conversation memory for the current chat, or None
+            
+        Returns:
+            True if the answer would depend on earlier turns
+        """
+        return memory is not None and memory.is_follow_up(question)
+    
+    def lookup_cached_answer(self, question: str, source_filter: str = None,
+                             memory: Optional[ConversationMemory] = None) -> Optional[str]:
+        """
+        Look up an answer to a semantically similar question in the cache.
+        
+        Call this before retrieval so a cache hit skips both the search and the LLM.
+        
+        Args:
+            question: User's question
+            source_filter: Document source the question is scoped to (None for all)
+            memory: Optional conversation memory; follow-ups that depend on it are never
+                    answered from the cache
+            
+        Returns:
+            Cached answer, or None if there is no cache or no sufficiently similar question
+        """
+        if self.semantic_cache is None or self.depends_on_history(question, memory):
+            return None
+        return self.semantic_cache.lookup(question, source_filter=source_filter)
+    
+    def answer_question(self, question: str, documents: List[Document], source_filter: str = None,
+                        cache_checked: bool = False, memory: Optional[ConversationMemory] = None) -> str:
         """
         Answer a question, adaptively using retrieval based on the question type.
         
         Args:
             question: Question to answer
             documents: List of Document objects to use as context (if needed)
+            source_filter: Document source the question is scoped to, used as the cache scope
+            cache_checked: Set when the caller already called lookup_cached_answer and missed
+            memory: Optional conversation memory; its bounded history is added to the
+                    prompt and the finished turn is recorded in it
             
         Returns:
             Answer to the question
         """
+        # Answers to unresolved follow-ups only fit this conversation
+        history_dependent = self.depends_on_history(question, memory)
+        
+        if not cache_checked:
+            cached_answer = self.lookup_cached_answer(question, source_filter, memory)
+            if cached_answer is not None:
+                self.remember(memory, question, cached_answer)
+                return cached_answer
+        
+        history = memory.format_history() if memory is not None else ""
+        
         # Decide whether to use retrieval
         use_retrieval, confidence, explanation = self.decide_retrieval(question)
         
@@ -196,11 +482,115 @@ class RAGChatbot:
         
         # Answer based on decision
         if use_retrieval:
-            answer = self.answer_with_retrieval(question, documents)
+            # Lookup questions are answered from the text directly when confident enough
+            answer = self.extractive_answer(question, documents)
+            if answer is None:
+                answer = self.answer_with_retrieval(question, documents, history)
+            cacheable = bool(documents)
         else:
-            answer = self.direct_answer(question)
+            answer = self.direct_answer(question, history)
+            cacheable = True
+        
+        # Never cache failures or answers that only fit this conversation
+        if self.semantic_cache is not None and cacheable and not history_dependent \
+                and not answer.startswith("Error generating response"):
+            self.semantic_cache.store(question, answer, source_filter=source_filter)
+        
+        self.remember(memory, question, answer)
         
         # For now, we'll return the answer without the debug info
         # But in a real application, you might want to include a debug mode
         # return answer + debug_info
         return answer
+    
+    def answer_many(self, questions: List[str], vector_store, k: int = 4, source_filter: str = None,
+                    max_workers: int = 4, output_path: str = None) -> Iterator[Dict[str, Any]]:
+        """
+        Answer many questions against the same document set.
+        
+        Retrieval is done in bulk: RAGate decides for every question up front, all
+        questions that need retrieval are embedded in one encode batch and searched
+        with one multi-row index search. Only the LLM calls run per question, through
+        a bounded thread pool; the provider layer retries rate-limited calls with
+        exponential backoff.
+        
+        Results are yielded as soon as each answer is ready (not in input order) and,
+        if output_path is given, appended to that JSONL file line by line, so partial
+        results survive an interruption. Closing the generator early cancels the
+        questions not started yet. Query expansion, MMR and the semantic cache
+        are not applied in batch mode; extractive answers are, when enabled.
+        
+        Args:
+            questions: Questions to answer
+            vector_store: Vector store to search
+            k: Number of documents to retrieve per question
+            source_filter: Optional document source to restrict the search to
+            max_workers: Maximum number of concurrent LLM calls
+            output_path: Optional JSONL file to append results to
+            
+        Yields:
+            Dictionaries with index, question, answer, used_retrieval, extractive,
+            confidence, sources, error and latency (seconds)
+        """
+        decisions = self.decide_retrieval_many(questions)
+        retrieval_indices = [i for i, (use_retrieval, _) in enumerate(decisions) if use_retrieval]
+        retrieved = vector_store.similarity_search_batch(
+            [questions[i] for i in retrieval_indices], k=k, source_filter=source_filter
+        )
+        documents_for = dict(zip(retrieval_indices, retrieved))
+        
+        def answer_one(index: int) -> Dict[str, Any]:
+            question = questions[index]
+            use_retrieval, confidence = decisions[index]
+            documents = documents_for.get(index, [])
+            start = time.time()
+            answer, error = None, None
+            extractive = False
+            try:
+                if use_retrieval and not documents:
+                    answer = "I don't have any documents to reference for answering your question."
+                elif use_retrieval:
+                    answer = self.extractive_answer(question, documents)
+                    extractive = answer is not None
+                    if not extractive:
+                        answer = self._generate(
+                            self.qa_prompt,
+                            context=self.format_context(documents),
+                            question=question,
+                            history="(none)"
+                        )
+                else:
+                    answer = self._generate(self.direct_prompt, question=question, history="(none)")
+            except Exception as e:
+                error = str(e)
+            return {
+                "index": index,
+                "question": question,
+                "answer": answer,
+                "used_retrieval": use_retrieval,
+                "extractive": extractive,
+                "confidence": confidence,
+                "sources": sorted({doc.metadata.get("source", "Unknown source") for doc in documents}),
+                "error": error,
+                "latency": round(time.time() - start, 3),
+            }
+        
+        output_file = open(output_path, "a", encoding="utf-8") if output_path else None
+        pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="answer-many")
+        futures = []
+        try:
+            futures = [pool.submit(answer_one, i) for i in range(len(questions))]
+            for future in as_completed(futures):
+                result = future.result()
+                if output_file is not None:
+                    output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output_file.flush()
+                yield result
+        finally:
+            # If the caller stops iterating (or fails), don't spend LLM calls on
+            # questions nobody will read; calls already running finish on their own
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+            if output_file is not None:
+                output_file.close()
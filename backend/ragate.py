@@ -106,6 +106,18 @@ class RAGate:
         # Decision based on confidence threshold
         return confidence >= self.confidence_threshold, confidence
     
+    def decide_many(self, queries: List[str]) -> List[Tuple[bool, float]]:
+        """
+        Decide whether to use retrieval for many queries at once.
+        
+        Args:
+            queries: The user queries to analyze
+            
+        Returns:
+            List of (use_retrieval, confidence) tuples, one per query
+        """
+        return [self.decide(query) for query in queries]
+    
     def explain_decision(self, query: str) -> str:
         """
         Provide an explanation for the retrieval decision.
@@ -0,0 +1,192 @@
+"""
+Semantic Response Cache
+
+This module caches chatbot answers keyed on the meaning of the question rather than
+its exact text. Past question embeddings are kept in a small FAISS inner-product
+index; a new question whose cosine similarity to a cached one exceeds the threshold
+reuses that answer instead of triggering another LLM call.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+
+class _CacheEntry:
+    """A cached answer and the question that produced it."""
+
+    def __init__(self, question: str, answer: str, scope: Optional[str]):
+        self.question = question
+        self.answer = answer
+        self.scope = scope
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query-embedding similarity.
+
+    Entries are scoped by source filter (a cached answer about one document is never
+    returned for another) and by the vector store's corpus version: whenever the
+    store is modified by add_documents or clear, the whole cache is invalidated on
+    the next access. The least recently used entry is evicted once `max_entries` is
+    reached.
+    """
+
+    def __init__(self, vector_store, similarity_threshold: float = 0.92, max_entries: int = 256):
+        """
+        Initialize the semantic cache.
+
+        Args:
+            vector_store: Vector store whose embedding model and version the cache follows
+            similarity_threshold: Minimum cosine similarity for a cache hit (0.0-1.0)
+            max_entries: Maximum number of cached answers before LRU eviction
+        """
+        self.vector_store = vector_store
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._indexes: Dict[Optional[str], faiss.Index] = {}
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._corpus_version = getattr(vector_store, "version", 0)
+        self._last_embedding = (None, None)
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        """Embed and L2-normalize a question, reusing the last embedding if possible."""
+        cached_question, cached_embedding = self._last_embedding
+        if cached_question == question:
+            return cached_embedding
+
+        embedding = self.vector_store.embed_documents([question]).astype(np.float32)
+        faiss.normalize_L2(embedding)
+        self._last_embedding = (question, embedding)
+        return embedding
+
+    def _check_version(self) -> None:
+        """Invalidate the cache if the vector store changed since it was filled."""
+        version = getattr(self.vector_store, "version", 0)
+        if version != self._corpus_version:
+            # The store may also have switched embedding models
+            self._clear_entries()
+            self._last_embedding = (None, None)
+            self._corpus_version = version
+            self.invalidations += 1
+
+    def _clear_entries(self) -> None:
+        """Drop every entry and index."""
+        self._indexes = {}
+        self._entries = OrderedDict()
+
+    def lookup(self, question: str, source_filter: str = None) -> Optional[str]:
+        """
+        Look up a cached answer for a semantically similar question.
+
+        Args:
+            question: User's question
+            source_filter: Document source the question is scoped to (None for all)
+
+        Returns:
+            Cached answer, or None on a miss
+        """
+        embedding = self._embed(question)
+
+        with self._lock:
+            self._check_version()
+
+            index = self._indexes.get(source_filter)
+            if index is None or index.ntotal == 0 or index.d != embedding.shape[1]:
+                self.misses += 1
+                return None
+
+            similarities, ids = index.search(embedding, 1)
+            entry_id = int(ids[0][0])
+            if entry_id == -1 or similarities[0][0] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[entry_id]
+            self._entries.move_to_end(entry_id)
+            entry.hits += 1
+            self.hits += 1
+            return entry.answer
+
+    def store(self, question: str, answer: str, source_filter: str = None) -> None:
+        """
+        Cache an answer for a question.
+
+        Args:
+            question: User's question
+            answer: Answer to cache
+            source_filter: Document source the question was scoped to (None for all)
+        """
+        embedding = self._embed(question)
+
+        with self._lock:
+            self._check_version()
+
+            index = self._indexes.get(source_filter)
+            if index is not None and index.d != embedding.shape[1]:
+                # Embedded with a model the store has since replaced
+                return
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+                self._indexes[source_filter] = index
+
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(embedding, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = _CacheEntry(question, answer, source_filter)
+
+            # Evict least recently used entries
+            while len(self._entries) > self.max_entries:
+                old_id, old_entry = self._entries.popitem(last=False)
+                self._indexes[old_entry.scope].remove_ids(np.array([old_id], dtype=np.int64))
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop all cached answers."""
+        with self._lock:
+            self._clear_entries()
+            self.invalidations += 1
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the cached vectors and answers."""
+        with self._lock:
+            vectors = sum(index.ntotal * (index.d * 4 + 8) for index in self._indexes.values())
+            texts = sum(len(entry.question) + len(entry.answer) for entry in self._entries.values())
+            return vectors + texts
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get cache metrics.
+
+        Returns:
+            Dictionary with size, hits, misses, hit rate, evictions and invalidations
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
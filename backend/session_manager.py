@@ -0,0 +1,299 @@
+"""
+Session Resource Management
+
+Streamlit keeps everything a session puts in st.session_state in server memory for as
+long as the browser tab stays open. This module bounds what a session can hold:
+ChatHistory keeps only a window of recent messages in memory and pages older ones out
+to a JSONL file, and SessionRegistry tracks when each session was last active,
+releases the resources of sessions that have been idle for too long and deletes the
+spill files of sessions it no longer expects back.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+SPILL_SUFFIX = ".jsonl"
+
+
+def _make_private_directory(path: str) -> None:
+    """Create a directory only the current user can read (spilled transcripts are plaintext)."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    try:
+        os.chmod(path, 0o700)
+    except OSError:
+        # Not ours to change (e.g. created by another user); files are still created 0600
+        pass
+
+
+class ChatHistory:
+    """
+    Chat transcript with a bounded in-memory window.
+
+    Behaves like the list of {"role", "content"} messages it replaces for appending,
+    iterating (over the in-memory window) and truthiness. Messages that fall out of
+    the window are appended to a JSONL file; their byte offsets are kept so earlier
+    pages can be read back without scanning the file.
+    """
+
+    def __init__(self, path: str, window: int = 40):
+        """
+        Initialize the chat history.
+
+        Args:
+            path: JSONL file older messages are spilled to
+            window: Number of most recent messages kept in memory
+        """
+        self.path = path
+        self.window = window
+        self.messages: List[Dict[str, str]] = []
+        self._offsets: List[int] = []
+
+    @property
+    def spilled(self) -> int:
+        """Number of messages paged out to disk."""
+        return len(self._offsets)
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def append(self, message: Dict[str, str]) -> None:
+        """
+        Add a message, spilling the oldest in-memory messages beyond the window.
+
+        Args:
+            message: Dictionary with "role" and "content"
+        """
+        self.messages.append(message)
+        if len(self.messages) > self.window:
+            overflow = len(self.messages) - self.window
+            self._spill(self.messages[:overflow])
+            self.messages = self.messages[overflow:]
+
+    def spill_all(self) -> None:
+        """Page every in-memory message out to disk (e.g. when the session goes idle)."""
+        if self.messages:
+            self._spill(self.messages)
+            self.messages = []
+
+    def _spill(self, messages: List[Dict[str, str]]) -> None:
+        """Append messages to the spill file, recording where each one starts."""
+        _make_private_directory(os.path.dirname(self.path) or ".")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            for message in messages:
+                self._offsets.append(f.tell())
+                f.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def load_spilled(self, count: int) -> List[Dict[str, str]]:
+        """
+        Read the most recent spilled messages back from disk.
+
+        Args:
+            count: Maximum number of messages to read
+
+        Returns:
+            Messages in chronological order, ending just before the in-memory window
+        """
+        if count <= 0 or not self._offsets:
+            return []
+        start = max(0, len(self._offsets) - count)
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[start])
+            lines = f.read().splitlines()
+        return [json.loads(line) for line in lines[:len(self._offsets) - start]]
+
+    def clear(self) -> None:
+        """Forget every message and delete the spill file."""
+        self.messages = []
+        self._offsets = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the in-memory window and the spill index."""
+        return sum(len(m["role"]) + len(m["content"]) for m in self.messages) + 8 * len(self._offsets)
+
+
+class SessionRegistry:
+    """
+    Process-wide record of session activity with idle-session eviction.
+
+    Each script run touches its session and registers a callback that releases the
+    session's heavy resources (its view of the shared index, ingestion workers,
+    caches). Sessions not touched for `idle_timeout` seconds are released on a
+    later sweep; when such a session comes back, touch() reports it so the app can
+    rebuild its resources.
+
+    With a spill directory, the registry also owns the sessions' chat spill files:
+    a file is deleted once its session has been evicted for longer than `spill_ttl`
+    or is dropped from the evicted list, and files left by sessions the registry
+    doesn't know (e.g. from an earlier process) are deleted once they are older than
+    `spill_ttl`.
+    """
+
+    def __init__(self, idle_timeout: float = 1800.0, sweep_interval: float = 60.0,
+                 max_evicted: int = 10000, spill_dir: Optional[str] = None,
+                 spill_ttl: float = 86400.0):
+        """
+        Initialize the session registry.
+
+        Args:
+            idle_timeout: Seconds of inactivity after which a session is released
+            sweep_interval: Minimum seconds between sweeps for idle sessions
+            max_evicted: Number of evicted session ids remembered
+            spill_dir: Directory of the sessions' chat spill files (created with mode 0700)
+            spill_ttl: Seconds a spill file is kept after its session was evicted
+        """
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.max_evicted = max_evicted
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        self._sessions: Dict[str, float] = {}
+        self._releases: Dict[str, Callable[[], None]] = {}
+        self._evicted: "OrderedDict[str, float]" = OrderedDict()
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        if spill_dir is not None:
+            _make_private_directory(spill_dir)
+
+    def spill_path(self, session_id: str) -> str:
+        """
+        Get the file a session's chat history spills to.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            Path inside the spill directory
+        """
+        if self.spill_dir is None:
+            raise ValueError("SessionRegistry was created without a spill directory")
+        return os.path.join(self.spill_dir, session_id + SPILL_SUFFIX)
+
+    def was_evicted(self, session_id: str) -> bool:
+        """
+        Check (and clear) whether a session was released while idle.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            True if the session's resources were released since its last run
+        """
+        with self._lock:
+            return self._evicted.pop(session_id, None) is not None
+
+    def touch(self, session_id: str, release: Optional[Callable[[], None]] = None) -> None:
+        """
+        Record activity for a session and sweep for idle ones.
+
+        Args:
+            session_id: Session identifier
+            release: Callback releasing the session's resources if it goes idle
+        """
+        with self._lock:
+            self._sessions[session_id] = time.time()
+            if release is not None:
+                self._releases[session_id] = release
+        self.sweep()
+
+    def sweep(self, force: bool = False) -> List[str]:
+        """
+        Release every session idle for longer than the timeout.
+
+        Args:
+            force: Sweep even if the last sweep was less than sweep_interval ago
+
+        Returns:
+            Ids of the sessions released
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_interval:
+                return []
+            self._last_sweep = now
+            idle = [sid for sid, seen in self._sessions.items() if now - seen > self.idle_timeout]
+            releases = []
+            for session_id in idle:
+                del self._sessions[session_id]
+                releases.append(self._releases.pop(session_id, None))
+                self._evicted[session_id] = now
+                self.evictions += 1
+            # Evicted ids are ordered by eviction time, oldest first
+            forgotten = []
+            while self._evicted and (len(self._evicted) > self.max_evicted
+                                     or now - next(iter(self._evicted.values())) > self.spill_ttl):
+                forgotten.append(self._evicted.popitem(last=False)[0])
+            known = set(self._sessions) | set(self._evicted)
+
+        # Release outside the lock; one failing session must not block the others
+        for release in releases:
+            if release is not None:
+                try:
+                    release()
+                except Exception:
+                    pass
+        if self.spill_dir is not None:
+            self._delete_spill_files(forgotten, known, now)
+        return idle
+
+    def _delete_spill_files(self, forgotten: List[str], known: Set[str], now: float) -> None:
+        """Delete the spill files of forgotten sessions and stale files of unknown ones."""
+        for session_id in forgotten:
+            try:
+                os.remove(self.spill_path(session_id))
+            except OSError:
+                pass
+        try:
+            names = os.listdir(self.spill_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(SPILL_SUFFIX) or name[:-len(SPILL_SUFFIX)] in known:
+                continue
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.spill_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get session statistics.
+
+        Returns:
+            Dictionary with active sessions, evictions and idle timeout
+        """
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "evictions": self.evictions,
+                "idle_timeout": self.idle_timeout,
+            }
+
+
+def format_bytes(num_bytes: float) -> str:
+    """
+    Format a byte count for display.
+
+    Args:
+        num_bytes: Number of bytes
+
+    Returns:
+        Human-readable size such as "1.2 MB"
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
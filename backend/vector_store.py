@@ -1,9 +1,123 @@
 import os
-from typing import List, Dict, Any
+import re
+import json
+import shutil
+import threading
+import time
+from typing import List, Dict, Any, Optional, Sequence, Iterable, Callable
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 from langchain.schema.document import Document
+from backend.embedding_models import get_model
+from backend.write_ahead_log import WriteAheadLog, fsync_directory
+
+def _document_to_dict(doc: Optional[Document]) -> Optional[Dict[str, Any]]:
+    """Serialize a document to JSON-compatible data."""
+    if doc is None:
+        return None
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+def _document_from_dict(data: Optional[Dict[str, Any]]) -> Optional[Document]:
+    """Rebuild a document serialized by _document_to_dict."""
+    if data is None:
+        return None
+    return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+def _write_durably(path: str, data: bytes) -> None:
+    """Write a file and fsync it."""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+# Snapshots are written to a fresh snapshot-<generation> directory; the CURRENT file
+# names the complete one, so switching snapshots is a single atomic rename
+SNAPSHOT_POINTER = "CURRENT"
+SNAPSHOT_DIR_REGEX = re.compile(r"^snapshot-(\d{8})$")
+SNAPSHOT_FILES = ("index.faiss", "child_parent.npy", "store.json")
+
+def maximal_marginal_relevance(relevance: np.ndarray, candidate_embeddings: np.ndarray,
+                               k: int = 4, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Select a relevant but diverse subset of candidates with Maximal Marginal Relevance.
+    
+    Each step picks the candidate maximizing
+    lambda_mult * relevance - (1 - lambda_mult) * (max cosine similarity to anything already picked).
+    The pairwise similarity matrix is computed once with a single matrix product and
+    the running "max similarity to the selection" is updated as a vector, so the
+    selection is O(k * n) NumPy work (well under a millisecond for 100 candidates).
+    
+    Args:
+        relevance: Relevance score of each candidate to the query, shape (n,)
+        candidate_embeddings: Candidate vectors, shape (n, dim)
+        k: Number of candidates to select
+        lambda_mult: 1.0 ranks purely by relevance, 0.0 purely by diversity
+        
+    Returns:
+        Indices into the candidate arrays, in selection order
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    k = min(k, n)
+    
+    vectors = candidate_embeddings / np.maximum(np.linalg.norm(candidate_embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[:, selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, similarity[:, chosen], out=max_similarity)
+    
+    return selected
+
+
+class EmbeddingMigration:
+    """
+    State of a background re-embedding of a store's documents with a new model.
+    
+    The new vectors are collected in their own index, aligned with the first
+    `done` document rows. The store keeps serving queries from its current index
+    until every row has been re-embedded, then switches to the new one.
+    """
+    
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    
+    def __init__(self, model_name: str, model: SentenceTransformer, batch_size: int = 256):
+        """
+        Initialize a migration.
+        
+        Args:
+            model_name: Name of the model to migrate to
+            model: The loaded model
+            batch_size: Number of documents re-embedded per batch
+        """
+        self.model_name = model_name
+        self.model = model
+        self.batch_size = batch_size
+        self.embedding_dim = model.get_sentence_embedding_dimension()
+        self.index = faiss.IndexFlatL2(self.embedding_dim)
+        self.done = 0
+        # Bumped whenever removals shift document rows, so an in-flight batch is redone
+        self.epoch = 0
+        self.status = self.RUNNING
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.cancel_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
 
 class FAISSVectorStore:
     """
@@ -27,7 +141,7 @@ class FAISSVectorStore:
     - Size: Relatively small model that works well for most use cases
     """
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", model: Optional[SentenceTransformer] = None):
         """
         Initialize the FAISS vector store.
         
@@ -35,6 +149,8 @@ class FAISSVectorStore:
             model_name: Name of the sentence transformer model to use for embeddings.
                       Defaults to 'all-MiniLM-L6-v2' which provides a good balance
                       between performance and quality.
+            model: Optional already-loaded model for model_name, so several stores
+                   can share one copy of the weights
         
         The initialization process:
         1. Loads the specified sentence transformer model
@@ -42,8 +158,9 @@ class FAISSVectorStore:
         3. Initializes a FAISS index using L2 distance metric
         4. Sets up storage for documents and their metadata
         """
-        # Initialize the sentence transformer model
-        self.model = SentenceTransformer(model_name)
+        # Initialize the sentence transformer model (shared through the model registry)
+        self.model_name = model_name
+        self.model = model if model is not None else get_model(model_name)
         
         # Initialize empty FAISS index
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
@@ -53,6 +170,35 @@ class FAISSVectorStore:
         self.documents = []
         self.document_sources = set()
         
+        # Parent sections for small-to-big retrieval, keyed by a parent id that never
+        # changes (chunks carry it as metadata["parent_id"] and results handed out before
+        # a removal must still resolve). child_parent maps each index row to its parent
+        # id (-1 for chunks without a parent) so a removal can find and delete the
+        # parents it leaves without children
+        self.parents: Dict[int, Document] = {}
+        self.next_parent_id = 0
+        self.child_parent = np.zeros(0, dtype=np.int32)
+        
+        # Guards the index and document list so background ingestion can add
+        # documents while the chat keeps searching
+        self._lock = threading.RLock()
+        
+        # Incremented on every mutation so caches can detect a changed corpus
+        self.version = 0
+        
+        # Background re-embedding with another model (see start_migration())
+        self.migration: Optional[EmbeddingMigration] = None
+        
+        # Write-ahead log for durable stores (see open()); wal_segment is the first
+        # log segment not covered by the last snapshot
+        self.path: Optional[str] = None
+        self.wal: Optional[WriteAheadLog] = None
+        self.wal_segment = 0
+        self._save_lock = threading.Lock()
+        self._compaction_stop: Optional[threading.Event] = None
+        self._compaction_thread: Optional[threading.Thread] = None
+        self.last_compaction_error: Optional[str] = None
+        
     def _get_embedding(self, text: str) -> np.ndarray:
         """
         Generate a dense vector embedding for a given text string.
@@ -69,41 +215,178 @@ class FAISSVectorStore:
         """
         return self.model.encode([text])[0]
     
-    def add_documents(self, documents: List[Document]) -> None:
+    def embed_documents(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Generate embeddings for a batch of texts without touching the index.
+        
+        This lets callers (e.g. the background ingestion queue) do the expensive
+        encoding outside the store lock and add the finished vectors in one step.
+        
+        Args:
+            texts: List of text strings to embed
+            batch_size: Number of texts the model encodes per forward pass
+            
+        Returns:
+            Numpy array of shape (len(texts), embedding_dim)
+        """
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    
+    def add_documents(self, documents: List[Document], embeddings: Optional[np.ndarray] = None,
+                      parents: Optional[List[Document]] = None, model_name: Optional[str] = None) -> None:
         """
         Add documents to the vector store by converting them to embeddings.
         
         This method:
-        1. Generates embeddings for all documents in a batch
+        1. Generates embeddings for all documents in a batch (unless precomputed)
         2. Adds the embeddings to the FAISS index
         3. Stores the original documents and their metadata
         4. Updates the set of document sources
         
+        When parents are given, the documents are child chunks whose
+        metadata["parent_index"] points into that list. The parents are stored
+        (not embedded) and each child gets a stable metadata["parent_id"].
+        
         Args:
             documents: List of Document objects to add to the vector store
+            embeddings: Optional precomputed embeddings, one row per document
+            parents: Optional parent sections referenced by the documents
+            model_name: Model that produced the precomputed embeddings; if the store
+                        has switched models since, they are recomputed
         """
         if not documents:
             return
+        texts = [doc.page_content for doc in documents]
+        
+        while True:
+            if embeddings is None:
+                # Get embeddings for all documents, outside the lock so searches continue
+                with self._lock:
+                    model, model_name = self.model, self.model_name
+                embeddings = model.encode(texts, batch_size=32)
+            if len(embeddings) != len(documents):
+                raise ValueError("Number of embeddings does not match number of documents")
+            embeddings = np.asarray(embeddings, dtype=np.float32)
             
-        # Get embeddings for all documents
-        embeddings = self.model.encode([doc.page_content for doc in documents])
+            with self._lock:
+                if model_name is None or model_name == self.model_name:
+                    self._add_embedded(documents, embeddings, parents)
+                    return
+            # Embedded just before a model switch: redo it with the active model
+            embeddings = None
+    
+    def _add_embedded(self, documents: List[Document], embeddings: np.ndarray,
+                      parents: Optional[List[Document]]) -> None:
+        """Log and apply an add whose embeddings match the active model. Must hold the store lock."""
+        # Reject a bad batch before it is logged; a logged batch that fails to apply
+        # would fail again on every replay and keep the store from opening
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(
+                f"Embeddings have shape {embeddings.shape}, expected (n, {self.embedding_dim}) "
+                f"for model {self.model_name}"
+            )
+        for doc in documents:
+            parent_index = doc.metadata.get("parent_index")
+            if parent_index is not None and not (parents and 0 <= parent_index < len(parents)):
+                raise ValueError(f"Chunk of {doc.metadata.get('source', 'unknown')} has an invalid parent_index")
+        
+        # Log the batch before applying it, parent_index references included
+        self._log({
+            "op": "add",
+            "model_name": self.model_name,
+            "documents": [_document_to_dict(doc) for doc in documents],
+            "parents": [_document_to_dict(doc) for doc in parents] if parents else None,
+        }, embeddings)
         
         # Add embeddings to FAISS index
-        self.index.add(embeddings.astype(np.float32))
+        self.index.add(embeddings)
+        
+        # Register parent sections and map each child row to its parent
+        parent_offset = self.next_parent_id
+        if parents:
+            for position, parent in enumerate(parents):
+                self.parents[parent_offset + position] = parent
+            self.next_parent_id += len(parents)
+        child_parent = np.full(len(documents), -1, dtype=np.int32)
         
         # Store documents and update sources
-        for doc in documents:
+        for row, doc in enumerate(documents):
             # Ensure document has source metadata
             if "source" not in doc.metadata:
                 doc.metadata["source"] = "unknown"
             
+            if parents and "parent_index" in doc.metadata:
+                doc.metadata["parent_id"] = parent_offset + doc.metadata.pop("parent_index")
+            if "parent_id" in doc.metadata:
+                child_parent[row] = doc.metadata["parent_id"]
+            
             # Add document source to our set of sources
             self.document_sources.add(doc.metadata["source"])
             
             # Add the document to our list
             self.documents.append(doc)
+        
+        self.child_parent = np.concatenate([self.child_parent, child_parent])
+        self.version += 1
+
+    def get_parent(self, parent_id: int) -> Optional[Document]:
+        """
+        Get a parent section by id.
+        
+        Args:
+            parent_id: Value of a child chunk's metadata["parent_id"]
+            
+        Returns:
+            Parent Document, or None if it doesn't exist (any more)
+        """
+        with self._lock:
+            return self.parents.get(parent_id)
+    
+    def _search_rows(self, query_embeddings: np.ndarray, k: int,
+                     doc_filter: Optional[Callable[[Document], bool]] = None) -> List[List[int]]:
+        """
+        Search the index and return the matching document rows for each query.
+        
+        Without a filter this is a single index.search call. With a filter, the
+        candidate pool starts at a few times k and grows geometrically until every
+        query has k matching rows or the whole index has been searched, instead of
+        always ranking every vector.
+        
+        Must be called with the store lock held.
+        
+        Args:
+            query_embeddings: Query vectors, one row per query
+            k: Number of matching rows wanted per query
+            doc_filter: Optional predicate a document must satisfy
+            
+        Returns:
+            List of document row lists, one per query, best match first
+        """
+        total = len(self.documents)
+        fetch = min(total, k if doc_filter is None else max(4 * k, 32))
+        while True:
+            distances, indices = self.index.search(query_embeddings, fetch)
+            rows = [
+                [int(i) for i in row if i != -1 and (doc_filter is None or doc_filter(self.documents[i]))]
+                for row in indices
+            ]
+            if fetch >= total or all(len(row) >= k for row in rows):
+                return [row[:k] for row in rows]
+            fetch = min(total, fetch * 4)
+    
+    @staticmethod
+    def _combine_filters(source_filter: Optional[str],
+                         doc_filter: Optional[Callable[[Document], bool]]) -> Optional[Callable[[Document], bool]]:
+        """Merge a source filter and a custom predicate into one predicate."""
+        if source_filter is None:
+            return doc_filter
+        if doc_filter is None:
+            return lambda doc: doc.metadata.get("source") == source_filter
+        return lambda doc: doc.metadata.get("source") == source_filter and doc_filter(doc)
     
-    def similarity_search(self, query: str, k: int = 4, source_filter: str = None) -> List[Document]:
+    def similarity_search(self, query: str, k: int = 4, source_filter: str = None,
+                          doc_filter: Optional[Callable[[Document], bool]] = None) -> List[Document]:
         """
         Perform semantic similarity search using FAISS.
         
@@ -120,6 +403,7 @@ class FAISSVectorStore:
             query: Query string to search for similar documents
             k: Number of similar documents to return (default: 4)
             source_filter: Optional filter to search only within a specific document source
+            doc_filter: Optional predicate restricting which documents may be returned
             
         Returns:
             List of Document objects sorted by similarity to the query
@@ -128,27 +412,231 @@ class FAISSVectorStore:
             return []
             
         # Get query embedding
+        model = self.model
         query_embedding = self._get_embedding(query)
         
-        # If source filter is applied, we need to search through all results
-        # and filter afterward to ensure we get enough matches
-        search_k = k if not source_filter else len(self.documents)
+        with self._lock:
+            if not self.documents:
+                return []
+            if model is not self.model:
+                query_embedding = self._get_embedding(query)
+            rows = self._search_rows(
+                query_embedding.reshape(1, -1).astype(np.float32),
+                k,
+                self._combine_filters(source_filter, doc_filter)
+            )
+            return [self.documents[i] for i in rows[0]]
+    
+    def similarity_search_batch(self, queries: List[str], k: int = 4, source_filter: str = None,
+                                doc_filter: Optional[Callable[[Document], bool]] = None) -> List[List[Document]]:
+        """
+        Run independent similarity searches for many queries at once.
         
-        # Perform similarity search
-        distances, indices = self.index.search(
-            query_embedding.reshape(1, -1).astype(np.float32),
-            min(search_k, len(self.documents))
-        )
+        All queries are encoded in one model.encode batch and searched with one
+        multi-row index.search call, which is much faster than calling
+        similarity_search in a loop.
+        
+        Args:
+            queries: Query strings to search for
+            k: Number of documents to return per query
+            source_filter: Optional filter to search only within a specific document source
+            doc_filter: Optional predicate restricting which documents may be returned
+            
+        Returns:
+            One list of Document objects per query, each sorted by similarity
+        """
+        if not self.documents or not queries:
+            return [[] for _ in queries]
+        
+        model = self.model
+        query_embeddings = self.embed_documents(list(queries))
+        
+        with self._lock:
+            if not self.documents:
+                return [[] for _ in queries]
+            if model is not self.model:
+                query_embeddings = self.embed_documents(list(queries))
+            rows = self._search_rows(query_embeddings, k, self._combine_filters(source_filter, doc_filter))
+            return [[self.documents[i] for i in row] for row in rows]
+    
+    def similarity_search_multi(self, queries: List[str], k: int = 4, source_filter: str = None,
+                                fetch_k: int = None, weights: Sequence[float] = None,
+                                rrf_k: int = 60,
+                                doc_filter: Optional[Callable[[Document], bool]] = None,
+                                mmr_lambda: Optional[float] = None) -> List[Document]:
+        """
+        Search with several query variants at once and merge the results.
+        
+        All variants are encoded in a single model.encode batch and searched with
+        a single multi-row index.search call. The per-variant rankings are then
+        merged using Reciprocal Rank Fusion (RRF), where a document scores
+        sum(weight / (rrf_k + rank)) over every ranking it appears in.
+        
+        Args:
+            queries: Query strings to search with (e.g. the question and its rewrites)
+            k: Number of documents to return after fusion
+            source_filter: Optional filter to search only within a specific document source
+            fetch_k: Candidates retrieved per variant before fusion (default: 2 * k)
+            weights: Optional per-query weights for fusion (default: 1.0 each)
+            rrf_k: RRF smoothing constant; larger values flatten rank differences
+            doc_filter: Optional predicate restricting which documents may be returned
+            mmr_lambda: If set, pick the final k from the fused candidates with Maximal
+                        Marginal Relevance using the fused scores as relevance
+            
+        Returns:
+            List of Document objects sorted by fused score (or in MMR selection order)
+        """
+        if not self.documents or not queries:
+            return []
+        if weights is None:
+            weights = [1.0] * len(queries)
+        
+        # One encode batch for every variant
+        model = self.model
+        query_embeddings = self.embed_documents(list(queries))
+        
+        with self._lock:
+            if not self.documents:
+                return []
+            if model is not self.model:
+                query_embeddings = self.embed_documents(list(queries))
+            
+            # One multi-row search for every variant
+            rows = self._search_rows(
+                query_embeddings,
+                fetch_k or 2 * k,
+                self._combine_filters(source_filter, doc_filter)
+            )
+            
+            # Reciprocal Rank Fusion over the per-variant rankings
+            scores: Dict[int, float] = {}
+            for row, weight in zip(rows, weights):
+                for rank, doc_idx in enumerate(row, 1):
+                    scores[doc_idx] = scores.get(doc_idx, 0.0) + weight / (rrf_k + rank)
+            
+            if mmr_lambda is None:
+                ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+                return [self.documents[i] for i in ranked]
+            
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            if not ranked:
+                # Nothing passed the filters
+                return []
+            candidates = self._reconstruct(ranked)
+            documents = [self.documents[i] for i in ranked]
+        
+        relevance = np.array([scores[i] for i in ranked], dtype=np.float32)
+        relevance /= relevance.max()
+        selected = maximal_marginal_relevance(relevance, candidates, k=k, lambda_mult=mmr_lambda)
+        return [documents[i] for i in selected]
+    
+    def _reconstruct(self, rows: List[int]) -> np.ndarray:
+        """Read stored vectors back from the index. Must be called with the store lock held."""
+        ids = np.array(rows, dtype=np.int64)
+        if hasattr(self.index, "reconstruct_batch"):
+            return self.index.reconstruct_batch(ids)
+        return np.vstack([self.index.reconstruct(int(i)) for i in ids])
+    
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, source_filter: str = None,
+                                      doc_filter: Optional[Callable[[Document], bool]] = None) -> List[Document]:
+        """
+        Retrieve a diverse top-k using Maximal Marginal Relevance.
+        
+        This method:
+        1. Fetches the fetch_k nearest candidates with one index search
+        2. Reconstructs the candidate vectors from the index (no re-encoding)
+        3. Picks k candidates balancing similarity to the query against similarity
+           to the chunks already picked, so overlapping neighbours aren't all returned
+        
+        Args:
+            query: Query string to search for similar documents
+            k: Number of documents to return
+            fetch_k: Number of candidates considered
+            lambda_mult: Trade-off between relevance (1.0) and diversity (0.0)
+            source_filter: Optional filter to search only within a specific document source
+            doc_filter: Optional predicate restricting which documents may be returned
+            
+        Returns:
+            List of Document objects in selection order
+        """
+        if not self.documents:
+            return []
+        
+        model = self.model
+        query_embedding = self._get_embedding(query).reshape(1, -1).astype(np.float32)
         
-        # Get matching documents
-        matches = [self.documents[i] for i in indices[0]]
+        with self._lock:
+            if not self.documents:
+                return []
+            if model is not self.model:
+                query_embedding = self._get_embedding(query).reshape(1, -1).astype(np.float32)
+            rows = self._search_rows(query_embedding, max(fetch_k, k), self._combine_filters(source_filter, doc_filter))[0]
+            if not rows:
+                return []
+            candidates = self._reconstruct(rows)
+            documents = [self.documents[i] for i in rows]
         
-        # Apply source filter if specified
-        if source_filter:
-            matches = [doc for doc in matches if doc.metadata.get("source") == source_filter]
-            matches = matches[:k]  # Limit to k results after filtering
+        query_vector = query_embedding[0] / max(np.linalg.norm(query_embedding[0]), 1e-12)
+        norms = np.maximum(np.linalg.norm(candidates, axis=1), 1e-12)
+        relevance = (candidates @ query_vector) / norms
+        selected = maximal_marginal_relevance(relevance, candidates, k=k, lambda_mult=lambda_mult)
+        return [documents[i] for i in selected]
+    
+    def remove_by_metadata(self, key: str, values: Iterable[Any]) -> int:
+        """
+        Remove every chunk whose metadata[key] is one of the given values.
+        
+        Args:
+            key: Metadata field to match (e.g. "source" or "doc_hash")
+            values: Values of that field to remove
+            
+        Returns:
+            Number of chunks removed
+        """
+        values = set(values)
+        with self._lock:
+            remove_ids = [i for i, doc in enumerate(self.documents) if doc.metadata.get(key) in values]
+            if not remove_ids:
+                return 0
+            
+            self._log({"op": "remove", "key": key, "values": list(values)})
+            
+            # IndexFlat compacts its storage, so the remaining rows keep their order
+            self.index.remove_ids(np.array(remove_ids, dtype=np.int64))
+            if self.migration is not None and self.migration.status == EmbeddingMigration.RUNNING:
+                migrated = [i for i in remove_ids if i < self.migration.done]
+                if migrated:
+                    self.migration.index.remove_ids(np.array(migrated, dtype=np.int64))
+                    self.migration.done -= len(migrated)
+                self.migration.epoch += 1
+            removed = set(remove_ids)
+            self.documents = [doc for i, doc in enumerate(self.documents) if i not in removed]
+            self.document_sources = {doc.metadata.get("source", "unknown") for doc in self.documents}
+            
+            # Keep the child-to-parent array aligned and delete parents with no children left
+            keep_mask = np.ones(len(self.child_parent), dtype=bool)
+            keep_mask[remove_ids] = False
+            dropped_parents = set(np.unique(self.child_parent[~keep_mask]).tolist()) - {-1}
+            self.child_parent = self.child_parent[keep_mask]
+            dropped_parents -= set(np.unique(self.child_parent).tolist())
+            for parent_id in dropped_parents:
+                self.parents.pop(parent_id, None)
+            
+            self.version += 1
+            return len(remove_ids)
+    
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        """
+        Remove every chunk belonging to the given document sources.
         
-        return matches
+        Args:
+            sources: Document source names to remove
+            
+        Returns:
+            Number of chunks removed
+        """
+        return self.remove_by_metadata("source", sources)
     
     def get_document_sources(self) -> List[str]:
         """
@@ -157,13 +645,444 @@ class FAISSVectorStore:
         Returns:
             List of document source names
         """
-        return list(self.document_sources)
+        with self._lock:
+            return list(self.document_sources)
     
     def clear(self) -> None:
         """Clear the vector store."""
-        # Reset FAISS index
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
+        with self._lock:
+            self._log({"op": "clear"})
+            
+            # Reset FAISS index
+            self.index = faiss.IndexFlatL2(self.embedding_dim)
+            if self.migration is not None and self.migration.status == EmbeddingMigration.RUNNING:
+                self.migration.index.reset()
+                self.migration.done = 0
+                self.migration.epoch += 1
+            
+            # Clear documents and sources
+            self.documents = []
+            self.document_sources = set()
+            # Parent ids keep counting so stale results can't resolve to new parents
+            self.parents = {}
+            self.child_parent = np.zeros(0, dtype=np.int32)
+            self.version += 1
+    
+    def start_migration(self, model_name: str, model: Optional[SentenceTransformer] = None,
+                        batch_size: int = 256) -> EmbeddingMigration:
+        """
+        Re-embed every document with another model in a background thread.
         
-        # Clear documents and sources
-        self.documents = []
-        self.document_sources = set()
+        This method:
+        1. Builds a second index for the new model (its dimension may differ)
+        2. Re-embeds the documents in batches outside the store lock, while
+           queries keep being served from the current index and model
+        3. Picks up documents added or removed in the meantime
+        4. Switches index and model in one step under the lock once every
+           document has been re-embedded
+        
+        A durable store logs the switch and compacts right after it. Progress is
+        not persisted: after a restart mid-migration the store still uses the old
+        model and the migration has to be started again.
+        
+        Args:
+            model_name: Name of the model to migrate to
+            model: Optional already-loaded model (default: from the model registry)
+            batch_size: Number of documents re-embedded per batch
+            
+        Returns:
+            EmbeddingMigration tracking the progress
+        """
+        with self._lock:
+            if self.migration is not None and self.migration.status == EmbeddingMigration.RUNNING:
+                raise ValueError(f"Already migrating to {self.migration.model_name}")
+            if model_name == self.model_name:
+                raise ValueError(f"Store already uses {model_name}")
+        
+        migration = EmbeddingMigration(model_name, model if model is not None else get_model(model_name), batch_size)
+        with self._lock:
+            self.migration = migration
+        migration.thread = threading.Thread(
+            target=self._run_migration, args=(migration,), name="embedding-migration", daemon=True
+        )
+        migration.thread.start()
+        return migration
+    
+    def _run_migration(self, migration: EmbeddingMigration) -> None:
+        """Re-embed documents batch by batch, then switch models."""
+        try:
+            while not migration.cancel_event.is_set():
+                with self._lock:
+                    start, epoch = migration.done, migration.epoch
+                    texts = [doc.page_content for doc in self.documents[start:start + migration.batch_size]]
+                    if not texts:
+                        self._switch_model(migration)
+                        break
+                
+                # The expensive part runs without the lock, so searches and adds continue
+                vectors = np.asarray(migration.model.encode(texts, batch_size=32), dtype=np.float32)
+                
+                with self._lock:
+                    # Discard the batch if removals shifted the rows while it was encoded
+                    if migration.epoch == epoch and migration.done == start:
+                        migration.index.add(vectors)
+                        migration.done += len(vectors)
+            else:
+                migration.status = EmbeddingMigration.CANCELLED
+                return
+        except Exception as e:
+            migration.status = EmbeddingMigration.FAILED
+            migration.error = str(e)
+            return
+        
+        if self.wal is not None:
+            try:
+                self.compact()
+            except Exception as e:
+                # The logged switch is replayed on startup, so nothing is lost
+                self.last_compaction_error = str(e)
+    
+    def _switch_model(self, migration: EmbeddingMigration) -> None:
+        """Make a completed migration's index and model the active ones. Must hold the store lock."""
+        self._log({"op": "switch_model", "model_name": migration.model_name})
+        self.index = migration.index
+        self.model = migration.model
+        self.model_name = migration.model_name
+        self.embedding_dim = migration.embedding_dim
+        migration.status = EmbeddingMigration.DONE
+        self.version += 1
+    
+    def migrate_now(self, model_name: str, model: Optional[SentenceTransformer] = None,
+                    batch_size: int = 256) -> None:
+        """
+        Re-embed every document with another model synchronously, holding the store lock.
+        
+        Args:
+            model_name: Name of the model to migrate to
+            model: Optional already-loaded model (default: from the model registry)
+            batch_size: Number of documents encoded per forward pass
+        """
+        migration = EmbeddingMigration(model_name, model if model is not None else get_model(model_name), batch_size)
+        with self._lock:
+            texts = [doc.page_content for doc in self.documents]
+            if texts:
+                migration.index.add(np.asarray(migration.model.encode(texts, batch_size=batch_size), dtype=np.float32))
+            migration.done = len(texts)
+            self.migration = migration
+            self._switch_model(migration)
+    
+    def cancel_migration(self) -> None:
+        """Stop a running migration; the store keeps its current model."""
+        migration = self.migration
+        if migration is not None and migration.status == EmbeddingMigration.RUNNING:
+            migration.cancel_event.set()
+            if migration.thread is not None:
+                migration.thread.join()
+    
+    def migration_status(self) -> Optional[Dict[str, Any]]:
+        """
+        Describe the current or last migration.
+        
+        Returns:
+            Dictionary with model_name, status, done, total, progress, elapsed and
+            error, or None if the store was never migrated
+        """
+        with self._lock:
+            migration = self.migration
+            if migration is None:
+                return None
+            total = len(self.documents)
+            return {
+                "model_name": migration.model_name,
+                "status": migration.status,
+                "done": migration.done,
+                "total": total,
+                "progress": migration.done / total if total else 1.0,
+                "elapsed": round(time.time() - migration.started_at, 1),
+                "error": migration.error,
+            }
+    
+    def _log(self, operation: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> None:
+        """Append a mutation to the write-ahead log, if the store is durable. Must hold the store lock."""
+        if self.wal is not None:
+            self.wal.append(operation, vectors)
+    
+    def _apply_log_record(self, operation: Dict[str, Any], vectors: Optional[np.ndarray]) -> None:
+        """Re-apply a mutation read back from the write-ahead log."""
+        if operation["op"] == "add":
+            self.add_documents(
+                [_document_from_dict(doc) for doc in operation["documents"]],
+                embeddings=vectors,
+                parents=[_document_from_dict(doc) for doc in operation["parents"]] if operation["parents"] else None,
+                model_name=operation.get("model_name", self.model_name),
+            )
+        elif operation["op"] == "remove":
+            self.remove_by_metadata(operation["key"], operation["values"])
+        elif operation["op"] == "clear":
+            self.clear()
+        elif operation["op"] == "switch_model":
+            # Crashed between a model switch and the snapshot after it: re-embed in place
+            self.migrate_now(operation["model_name"])
+        else:
+            raise ValueError(f"Unknown write-ahead log operation: {operation['op']}")
+    
+    def _replay_log(self, path: str, repair: bool = False) -> int:
+        """Apply every logged mutation newer than the loaded snapshot. Returns the number replayed."""
+        wal_dir = os.path.join(path, "wal")
+        if not os.path.isdir(wal_dir):
+            return 0
+        replayed = 0
+        for operation, vectors in WriteAheadLog(wal_dir).replay(self.wal_segment, repair=repair):
+            self._apply_log_record(operation, vectors)
+            replayed += 1
+        return replayed
+    
+    @staticmethod
+    def snapshot_path(path: str) -> Optional[str]:
+        """
+        Find the current snapshot of a store directory.
+        
+        Args:
+            path: Store directory passed to save()
+            
+        Returns:
+            Directory holding index.faiss, child_parent.npy and store.json, or None
+            if no snapshot was written yet
+        """
+        pointer = os.path.join(path, SNAPSHOT_POINTER)
+        if os.path.exists(pointer):
+            with open(pointer, "r", encoding="utf-8") as f:
+                return os.path.join(path, f.read().strip())
+        # Flat layout written before snapshot generations
+        if os.path.exists(os.path.join(path, "store.json")):
+            return path
+        return None
+    
+    def save(self, path: str) -> None:
+        """
+        Persist the vector store to a directory.
+        
+        The FAISS index is written to index.faiss, the child-to-parent array to
+        child_parent.npy and the documents, parents and store settings to
+        store.json, all in a new snapshot-<generation> subdirectory. Once every
+        file is fsynced, the CURRENT pointer file is atomically replaced to name
+        the new generation and older generations are deleted. A crash at any point
+        leaves either the previous or the new snapshot, never a mix of both.
+        
+        The store lock is only held while the state is copied (the index is
+        serialized in memory), so searches and adds continue during the disk
+        writes. Saving a durable store to its own directory rotates the
+        write-ahead log first and deletes the segments the snapshot covers.
+        
+        Args:
+            path: Directory to write the snapshot to (created if missing)
+        """
+        os.makedirs(path, exist_ok=True)
+        compacting = self.wal is not None and os.path.abspath(path) == self.path
+        
+        with self._save_lock:
+            with self._lock:
+                if compacting:
+                    # Mutations from here on go to a new segment the snapshot won't cover
+                    self.wal_segment = self.wal.rotate()
+                index_bytes = faiss.serialize_index(self.index)
+                child_parent = self.child_parent.copy()
+                state = {
+                    "model_name": self.model_name,
+                    "embedding_dim": self.embedding_dim,
+                    "num_vectors": self.index.ntotal,
+                    "wal_segment": self.wal_segment,
+                    "documents": [_document_to_dict(doc) for doc in self.documents],
+                    "parents": [[parent_id, _document_to_dict(doc)] for parent_id, doc in self.parents.items()],
+                    "next_parent_id": self.next_parent_id,
+                }
+                state_bytes = json.dumps(state).encode("utf-8")
+            
+            generations = [
+                int(match.group(1)) for match in map(SNAPSHOT_DIR_REGEX.match, os.listdir(path)) if match
+            ]
+            generation = f"snapshot-{max(generations, default=0) + 1:08d}"
+            snapshot_dir = os.path.join(path, generation)
+            os.makedirs(snapshot_dir)
+            
+            _write_durably(os.path.join(snapshot_dir, "index.faiss"), index_bytes.tobytes())
+            with open(os.path.join(snapshot_dir, "child_parent.npy"), "wb") as f:
+                np.save(f, child_parent)
+                f.flush()
+                os.fsync(f.fileno())
+            _write_durably(os.path.join(snapshot_dir, "store.json"), state_bytes)
+            fsync_directory(snapshot_dir)
+            
+            # The single atomic switch from the previous snapshot to this one
+            pointer = os.path.join(path, SNAPSHOT_POINTER)
+            _write_durably(pointer + ".tmp", generation.encode("utf-8"))
+            os.replace(pointer + ".tmp", pointer)
+            fsync_directory(path)
+            
+            for name in os.listdir(path):
+                if SNAPSHOT_DIR_REGEX.match(name) and name != generation:
+                    shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+            for name in SNAPSHOT_FILES:
+                # Superseded flat-layout snapshot
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            
+            if compacting:
+                self.wal.discard_before(state["wal_segment"])
+    
+    @classmethod
+    def load(cls, path: str, model: Optional[SentenceTransformer] = None) -> "FAISSVectorStore":
+        """
+        Load a vector store snapshot written by save().
+        
+        Mutations logged by a durable store after the snapshot (see open()) are
+        replayed on top, so the result reflects every acknowledged write. The log
+        itself is left untouched and the loaded store is not durable.
+        
+        Args:
+            path: Directory the snapshot was saved to
+            model: Optional already-loaded model matching the snapshot's model name
+            
+        Returns:
+            FAISSVectorStore with the saved index and documents
+        """
+        store = cls._load_snapshot(path, model=model)
+        store._replay_log(path)
+        return store
+    
+    @classmethod
+    def _load_snapshot(cls, path: str, model: Optional[SentenceTransformer] = None) -> "FAISSVectorStore":
+        """Load the snapshot files only, without replaying the write-ahead log."""
+        snapshot_dir = cls.snapshot_path(path)
+        if snapshot_dir is None:
+            raise FileNotFoundError(f"No vector store snapshot in {path}")
+        with open(os.path.join(snapshot_dir, "store.json"), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        index = faiss.read_index(os.path.join(snapshot_dir, "index.faiss"))
+        
+        if index.ntotal != len(state["documents"]):
+            raise ValueError(
+                f"Corrupt snapshot in {path}: {index.ntotal} vectors but {len(state['documents'])} documents"
+            )
+        
+        store = cls(model_name=state["model_name"], model=model)
+        if store.embedding_dim != index.d:
+            raise ValueError(
+                f"Snapshot dimension {index.d} does not match model {state['model_name']} ({store.embedding_dim})"
+            )
+        
+        store.index = index
+        store.wal_segment = state.get("wal_segment", 0)
+        store.documents = [_document_from_dict(doc) for doc in state["documents"]]
+        store.document_sources = {doc.metadata.get("source", "unknown") for doc in store.documents}
+        
+        if "next_parent_id" in state:
+            store.parents = {parent_id: _document_from_dict(doc) for parent_id, doc in state["parents"]}
+            store.next_parent_id = state["next_parent_id"]
+        else:
+            # Older snapshots stored parents by position, with None for deleted ones
+            parents = state.get("parents", [])
+            store.parents = {
+                parent_id: _document_from_dict(doc) for parent_id, doc in enumerate(parents) if doc is not None
+            }
+            store.next_parent_id = len(parents)
+        parents_path = os.path.join(snapshot_dir, "child_parent.npy")
+        if os.path.exists(parents_path):
+            store.child_parent = np.load(parents_path).astype(np.int32)
+        else:
+            store.child_parent = np.full(len(store.documents), -1, dtype=np.int32)
+        if len(store.child_parent) != len(store.documents):
+            raise ValueError(f"Corrupt snapshot in {path}: child-to-parent map does not match documents")
+        return store
+    
+    @classmethod
+    def open(cls, path: str, model_name: str = "all-MiniLM-L6-v2",
+             model: Optional[SentenceTransformer] = None) -> "FAISSVectorStore":
+        """
+        Open a durable vector store backed by a snapshot and a write-ahead log.
+        
+        This method:
+        1. Loads the snapshot in path, or starts an empty store if there is none
+        2. Replays the logged mutations newer than the snapshot, truncating a
+           record torn by a crash
+        3. Logs every later add, remove and clear (fsynced) before applying it
+        
+        Call save(path) or compact() to fold the log into a new snapshot, or
+        start_background_compaction() to do so automatically.
+        
+        Args:
+            path: Store directory (created if missing)
+            model_name: Sentence transformer model for a new store
+            model: Optional already-loaded model matching the store's model name
+            
+        Returns:
+            Durable FAISSVectorStore
+        """
+        os.makedirs(path, exist_ok=True)
+        has_snapshot = cls.snapshot_path(path) is not None
+        if has_snapshot:
+            store = cls._load_snapshot(path, model=model)
+        else:
+            store = cls(model_name=model_name, model=model)
+        store._replay_log(path, repair=True)
+        
+        wal = WriteAheadLog(os.path.join(path, "wal"))
+        wal.discard_before(store.wal_segment)
+        segments = wal.segments()
+        wal.start(max(store.wal_segment, segments[-1] + 1 if segments else 1))
+        store.wal = wal
+        store.path = os.path.abspath(path)
+        
+        # Write an initial snapshot so load() always finds one next to the log
+        if not has_snapshot:
+            store.compact()
+        return store
+    
+    def compact(self) -> None:
+        """
+        Fold the write-ahead log into a new snapshot of a durable store.
+        
+        Raises:
+            ValueError: If the store was not opened with open()
+        """
+        if self.wal is None:
+            raise ValueError("Only stores opened with FAISSVectorStore.open() have a write-ahead log")
+        self.save(self.path)
+    
+    def start_background_compaction(self, interval: float = 60.0,
+                                    min_log_bytes: int = 64 * 1024 * 1024) -> None:
+        """
+        Periodically compact the write-ahead log in a background thread.
+        
+        Args:
+            interval: Seconds between checks of the log size
+            min_log_bytes: Log size from which a compaction is triggered
+        """
+        if self.wal is None:
+            raise ValueError("Only stores opened with FAISSVectorStore.open() have a write-ahead log")
+        if self._compaction_thread is not None:
+            return
+        
+        def compaction_loop():
+            while not self._compaction_stop.wait(interval):
+                try:
+                    if self.wal.size() >= max(min_log_bytes, 1):
+                        self.compact()
+                    self.last_compaction_error = None
+                except Exception as e:
+                    # Keep logging; the next round retries with a fresh segment
+                    self.last_compaction_error = str(e)
+        
+        self._compaction_stop = threading.Event()
+        self._compaction_thread = threading.Thread(target=compaction_loop, name="wal-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def close(self) -> None:
+        """Stop background compaction and close the write-ahead log (the store becomes read-only on disk)."""
+        if self._compaction_thread is not None:
+            self._compaction_stop.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
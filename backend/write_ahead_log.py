@@ -0,0 +1,220 @@
+"""
+Write-Ahead Log
+
+This module provides the append-only log that makes vector store mutations durable
+between snapshots. Every add, remove and clear is written (and fsynced) as one framed
+record before it is applied, so the cost of a durable write is proportional to the
+batch being written, not to the size of the corpus. On startup the records written
+after the last snapshot are replayed; compaction writes a new snapshot and drops the
+log segments it covers.
+"""
+
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# magic, metadata length, vector payload length, CRC-32 of metadata + vectors
+RECORD_HEADER = struct.Struct("<4sIII")
+RECORD_MAGIC = b"DWAL"
+
+
+def fsync_directory(path: str) -> None:
+    """Make file creations, renames and deletions in a directory durable (no-op where unsupported)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Segmented append-only log of vector store mutations.
+
+    Records live in numbered segment files (wal-00000001.log, ...). Each record is a
+    fixed header followed by a JSON description of the operation and, for adds, the
+    raw float32 vectors. A record torn by a crash fails its length or checksum check
+    and ends the replay; when repairing, it is truncated away before new records are
+    appended.
+
+    Rotation starts a new segment so a snapshot can cover every segment before it;
+    once that snapshot is durable those segments are deleted.
+    """
+
+    SEGMENT_REGEX = re.compile(r"^wal-(\d{8})\.log$")
+
+    def __init__(self, directory: str, fsync: bool = True):
+        """
+        Initialize the log.
+
+        Args:
+            directory: Directory holding the segment files (created if missing)
+            fsync: Whether every append is fsynced before returning
+        """
+        self.directory = directory
+        self.fsync = fsync
+        self.segment: Optional[int] = None
+        self._file = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, segment: int) -> str:
+        """Path of a segment file."""
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def segments(self) -> List[int]:
+        """
+        List the segment numbers on disk.
+
+        Returns:
+            Segment numbers in ascending order
+        """
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = self.SEGMENT_REGEX.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def size(self) -> int:
+        """Total size of all segments on disk in bytes."""
+        return sum(os.path.getsize(self._segment_path(segment)) for segment in self.segments())
+
+    def replay(self, start_segment: int = 0,
+               repair: bool = False) -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        """
+        Read the records of every segment from start_segment on, in order.
+
+        Args:
+            start_segment: First segment to read (earlier ones are covered by the snapshot)
+            repair: Truncate a torn record at the end of the last segment
+                    (only the process that will append to the log should repair)
+
+        Yields:
+            (operation, vectors) pairs; vectors is None for operations without vectors
+
+        Raises:
+            ValueError: If a segment other than the last one is corrupt
+        """
+        segments = [segment for segment in self.segments() if segment >= start_segment]
+        for position, segment in enumerate(segments):
+            path = self._segment_path(segment)
+            with open(path, "rb") as f:
+                valid_end = 0
+                while True:
+                    record = self._read_record(f)
+                    if record is None:
+                        break
+                    valid_end = f.tell()
+                    yield record
+                torn = f.seek(0, os.SEEK_END) != valid_end
+
+            if torn:
+                if position != len(segments) - 1:
+                    raise ValueError(f"Corrupt write-ahead log segment {path}")
+                if repair:
+                    with open(path, "r+b") as f:
+                        f.truncate(valid_end)
+                        f.flush()
+                        os.fsync(f.fileno())
+
+    @staticmethod
+    def _read_record(f) -> Optional[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        """Read one record, or return None at the end of the file or at a torn record."""
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        magic, meta_len, vector_len, checksum = RECORD_HEADER.unpack(header)
+        if magic != RECORD_MAGIC:
+            return None
+        payload = f.read(meta_len + vector_len)
+        if len(payload) < meta_len + vector_len or zlib.crc32(payload) != checksum:
+            return None
+
+        operation = json.loads(payload[:meta_len].decode("utf-8"))
+        vectors = None
+        if vector_len:
+            vectors = np.frombuffer(payload[meta_len:], dtype=np.float32).reshape(-1, operation["dim"])
+        return operation, vectors
+
+    def start(self, segment: int) -> None:
+        """
+        Open a segment for appending.
+
+        Args:
+            segment: Segment number to append to
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.segment = segment
+            self._file = open(self._segment_path(segment), "ab")
+        fsync_directory(self.directory)
+
+    def append(self, operation: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> int:
+        """
+        Durably append one record.
+
+        Args:
+            operation: JSON-serializable description of the mutation
+            vectors: Optional float32 vectors belonging to the mutation
+
+        Returns:
+            Number of bytes written
+        """
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            operation = dict(operation, dim=int(vectors.shape[1]))
+        meta = json.dumps(operation, ensure_ascii=False).encode("utf-8")
+        vector_bytes = vectors.tobytes() if vectors is not None else b""
+        checksum = zlib.crc32(vector_bytes, zlib.crc32(meta))
+        record = RECORD_HEADER.pack(RECORD_MAGIC, len(meta), len(vector_bytes), checksum) + meta + vector_bytes
+
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Write-ahead log is not open for appending")
+            self._file.write(record)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        return len(record)
+
+    def rotate(self) -> int:
+        """
+        Close the current segment and start the next one.
+
+        Returns:
+            Number of the new segment; every earlier segment is now sealed
+        """
+        self.start((self.segment or 0) + 1)
+        return self.segment
+
+    def discard_before(self, segment: int) -> None:
+        """
+        Delete every segment before the given one (after a snapshot covers them).
+
+        Args:
+            segment: First segment to keep
+        """
+        for number in self.segments():
+            if number < segment:
+                os.remove(self._segment_path(number))
+        fsync_directory(self.directory)
+
+    def close(self) -> None:
+        """Close the open segment."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -56,6 +56,11 @@ def run_app():
     except Exception as e:
         print(f"❌ Error starting application: {str(e)}")
 
+def run_ingest(args):
+    """Run the bulk offline ingester with the given command-line arguments."""
+    from backend.bulk_ingest import main as ingest_main
+    return ingest_main(args)
+
 if __name__ == "__main__":
     # Check if requirements are installed
     if not os.path.exists("backend/__pycache__"):
@@ -71,6 +76,11 @@ if __name__ == "__main__":
             print("❌ Error installing requirements.")
             sys.exit(1)
     
+    # Bulk ingestion doesn't need the UI or an API key:
+    #   python run.py ingest path/to/pdfs --output data/index
+    if len(sys.argv) > 1 and sys.argv[1] == "ingest":
+        sys.exit(run_ingest(sys.argv[2:]))
+    
     # Check environment file
     env_ready = check_env_file()
     